@@ -0,0 +1,245 @@
+"""Бэкенд кеша Django в файле SQLite, общий для всех процессов узла."""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Максимальное кол-во параметров в одном запросе SQLite
+CHUNK_SIZE = 500
+
+SCHEMA = (
+    'PRAGMA journal_mode=WAL',
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+# Условие «запись не истекла»; параметр — текущее время
+ALIVE = '(expires IS NULL OR expires > ?)'
+
+
+def chunked(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite (LOCATION — путь к файлу)."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        # Как часто обновлять время доступа (сек.), раз во сколько
+        # записей проверять переполнение, сколько ждать блокировку (сек.)
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 10))
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        """Соединение своего потока; после fork открывается заново."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for sql in SCHEMA:
+                connection.execute(sql)
+            local.connection = connection
+            local.pid = os.getpid()
+            local.writes = 0
+        return local.connection
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, sql, params, many=False):
+        """Выполняет запись и изредка проверяет переполнение кеша."""
+        connection = self._connection
+        if many:
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                cursor = connection.executemany(sql, params)
+        else:
+            cursor = connection.execute(sql, params)
+        self._local.writes += 1
+        if self._local.writes % self._cull_every == 0:
+            self._cull()
+        return cursor
+
+    def _cull(self):
+        """Удаляет истекшие записи, а при переполнении — давно не читанные."""
+        connection = self._connection
+        now = time.time()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        (count,) = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,)
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._write(
+            'INSERT INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache.expires <= ?',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             now, now)
+        )
+        return cursor.rowcount > 0
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        values = self._get_many([key])
+        return values.get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        values = self._get_many(list(keys))
+        return {keys[key]: value for key, value in values.items()}
+
+    def _get_many(self, keys):
+        connection = self._connection
+        now = time.time()
+        values = {}
+        stale = []
+        for chunk in chunked(keys):
+            placeholders = ', '.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({placeholders}) AND {ALIVE}',
+                (*chunk, now)
+            )
+            for key, value, accessed in rows:
+                values[key] = self._load(value)
+                if accessed < now - self._touch_interval:
+                    stale.append(key)
+        for chunk in chunked(stale):
+            placeholders = ', '.join('?' * len(chunk))
+            connection.execute(
+                f'UPDATE cache SET accessed = ? '
+                f'WHERE key IN ({placeholders})',
+                (now, *chunk)
+            )
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._write(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             time.time())
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        self._write(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            [
+                (self._key(key, version), self._dump(value), expires, now)
+                for key, value in data.items()
+            ],
+            many=True,
+        )
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._write(
+            f'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), now, key, now)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', (key,)
+        )
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for chunk in chunked(keys):
+            placeholders = ', '.join('?' * len(chunk))
+            self._connection.execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', chunk
+            )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        rows = self._connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())
+        ).fetchall()
+        return bool(rows)
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно прибавляет delta к целому значению."""
+        made_key = self._key(key, version)
+        now = time.time()
+        rows = self._connection.execute(
+            f'UPDATE cache SET value = value + ?, accessed = ? '
+            f"WHERE key = ? AND typeof(value) = 'integer' AND {ALIVE} "
+            f'RETURNING value',
+            (delta, now, made_key, now)
+        ).fetchall()
+        if rows:
+            return rows[0][0]
+        # Значение не INTEGER (например, не влезло в 64 бита): обычный путь
+        return super().incr(key, delta, version)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живет весь процесс, как и у LocMemCache
+        pass
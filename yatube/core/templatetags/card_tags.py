@@ -0,0 +1,121 @@
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from posts.caching import cached_fragments, card_key
+
+from .user_filters import getstars
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+# Разделитель карточек на странице
+CARD_SEPARATOR = '\n<hr>\n'
+
+
+def render_stars(rating_avg):
+    """Звездочки рейтинга; вариантов немного, каждый рендерится раз."""
+    stars = getstars(rating_avg)
+    return render_star_counts(stars['full'], stars['half'], stars['empty'])
+
+
+@lru_cache(maxsize=None)
+def render_star_counts(full, half, empty):
+    return render_to_string(
+        'posts/includes/rating_stars.html',
+        {'stars': {'full': full, 'half': half, 'empty': empty}},
+    )
+
+
+class CardData:
+    """Данные карточек страницы: ссылки, имена авторов и звездочки.
+
+    Адреса профилей и групп вычисляются раз на автора и группу,
+    звездочки — раз на значение рейтинга. Карточки из кеша данных
+    не требуют, поэтому они считаются только для рендеринга.
+    """
+
+    def __init__(self):
+        self.profile_urls = {}
+        self.group_urls = {}
+
+    def profile_url(self, author):
+        url = self.profile_urls.get(author.pk)
+        if url is None:
+            url = self.profile_urls[author.pk] = reverse(
+                'posts:profile', args=[author.username]
+            )
+        return url
+
+    def group_url(self, group):
+        if group is None:
+            return None
+        url = self.group_urls.get(group.pk)
+        if url is None:
+            url = self.group_urls[group.pk] = reverse(
+                'posts:group_list', args=[group.slug]
+            )
+        return url
+
+    def __call__(self, post):
+        author = post.author
+        return {
+            'author_name': author.get_full_name() or author.username,
+            'profile_url': self.profile_url(author),
+            'group_url': self.group_url(post.group),
+            'detail_url': reverse('posts:post_detail', args=[post.pk]),
+            'stars': render_stars(post.rating_avg),
+        }
+
+
+class PostCardsNode(template.Node):
+
+    def __init__(self, posts):
+        self.posts = posts
+
+    def render(self, context):
+        posts = list(self.posts.resolve(context) or ())
+        if not posts:
+            return ''
+        group = context.get('group')
+        card_data = CardData()
+        card_template = context.template.engine.get_template(CARD_TEMPLATE)
+
+        def render(post):
+            values = {'post': post, 'card': card_data(post), 'group': group}
+            with context.push(values):
+                return card_template.render(context)
+
+        # Сниппет зависит от запроса, такие карточки не кешируем.
+        # На странице группы ссылка на группу в карточке не выводится
+        keys = {
+            card_key(post, int(bool(group))): post
+            for post in posts if not getattr(post, 'search_snippet', None)
+        }
+        html = cached_fragments(
+            'cards', keys, render, settings.POST_CARD_CACHE_TIMEOUT
+        )
+        keys = {post.pk: key for key, post in keys.items()}
+        return mark_safe(CARD_SEPARATOR.join(
+            html[keys[post.pk]] if post.pk in keys else render(post)
+            for post in posts
+        ))
+
+
+@register.tag
+def post_cards(parser, token):
+    """Карточки всех постов страницы, закешированные по версиям
+    поста, автора и группы.
+
+    Использование: {% post_cards page_obj %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает ровно один аргумент — список постов'
+        )
+    return PostCardsNode(parser.compile_filter(bits[1]))
@@ -1,7 +1,11 @@
 import math
 
 from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 from posts.models import RATING_CHOICES
+from posts.search import MATCH_END, MATCH_START
+from posts.thumbnails import get_thumbnail
 
 # Для регистрации нашего фильтра
 register = template.Library()
@@ -44,3 +48,19 @@ def getstars(rating_avg):
         'half': half,
         'empty': len(RATING_CHOICES) - full - half,
     }
+
+
+@register.filter
+def highlight(snippet):
+    """Для подсветки совпадений в сниппете найденного поста."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MATCH_START, '<mark>')
+        .replace(MATCH_END, '</mark>')
+    )
+
+
+@register.filter
+def thumbnail(post, name):
+    """Для вывода готовой миниатюры поста или заглушки."""
+    return get_thumbnail(post, name)
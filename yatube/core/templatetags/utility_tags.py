@@ -1,4 +1,4 @@
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 
 from django import template
 from django.utils.encoding import force_str
@@ -6,16 +6,79 @@ from django.utils.safestring import mark_safe
 
 register = template.Library()
 
+# Разделитель параметров, уже экранированный для атрибута href
+SEPARATOR = '&amp;'
 
-def construct_query_string(context, query_params):
-    # пустые значения будут удалены
-    query_string = context['request'].path
-    if len(query_params):
-        encoded_params = urlencode([
-            (key, force_str(value)) for (key, value) in query_params if value
-        ]).replace('&', '&amp;')
-        query_string += f'?{encoded_params}'
-    return mark_safe(query_string)
+
+def encode_param(key, values):
+    """Закодированная пара ключ-значения; пустые значения удаляются."""
+    key = quote_plus(key)
+    return SEPARATOR.join(
+        f'{key}={quote_plus(force_str(value))}' for value in values if value
+    )
+
+
+class QueryBuilder:
+    """Ссылки на текущую страницу с измененными GET-параметрами.
+
+    Строка запроса разбирается и кодируется один раз на запрос.
+    Для каждого набора удаляемых и изменяемых ключей запоминается
+    раскладка уже закодированных параметров, поэтому ссылка собирается
+    кодированием только измененных значений.
+    """
+
+    def __init__(self, request):
+        self.path = request.path
+        self.params = {
+            key: (len(values), encode_param(key, values))
+            for key, values in request.GET.lists()
+        }
+        self.layouts = {}
+
+    def layout(self, params_to_remove, keys_to_change):
+        """Закодированные параметры и ключи, значения которых меняются."""
+        memo = (params_to_remove, keys_to_change)
+        layout = self.layouts.get(memo)
+        if layout is None:
+            items = [
+                key if key in keys_to_change else encoded
+                for key, encoded in self.params.items()
+                if key not in params_to_remove
+            ]
+            present = keys_to_change.intersection(items)
+            layout = self.layouts[memo] = (items, present)
+        return layout
+
+    def build(self, params_to_remove, params_to_change):
+        items, present = self.layout(
+            frozenset(params_to_remove), frozenset(params_to_change)
+        )
+        # новые параметры прикрепляются в конец
+        items = items + [
+            key for key in params_to_change if key not in present
+        ]
+        parts = []
+        count = 0
+        for item in items:
+            if isinstance(item, str):
+                # кодируем только значения ключей из 'params_to_change'
+                item = (1, encode_param(item, [params_to_change[item]]))
+            values, encoded = item
+            count += values
+            if encoded:
+                parts.append(encoded)
+        query_string = self.path
+        if count:
+            query_string += '?' + SEPARATOR.join(parts)
+        return mark_safe(query_string)
+
+
+def query_builder(request):
+    """Построитель ссылок, общий для всех тегов одного запроса."""
+    builder = getattr(request, '_query_builder', None)
+    if builder is None:
+        builder = request._query_builder = QueryBuilder(request)
+    return builder
 
 
 def distrib_params(params, params_to_change):
@@ -34,19 +97,6 @@ def distrib_params(params, params_to_change):
 def modify_query(context, *params, **params_to_change):
     """Генерирует ссылку с модифицированными GET-параметрами."""
     params_to_remove = distrib_params(params, params_to_change)
-    query_params = []
-    for key, value_list in context['request'].GET.lists():
-        if key not in params_to_remove:
-            # игнорируем пару ключ-значения для 'params_to_remove'
-            if key in params_to_change:
-                # обновляем значения для ключей в 'params_to_change'
-                query_params.append((key, params_to_change[key]))
-                params_to_change.pop(key)
-            else:
-                # сохраняем остальные параметры, как есть
-                query_params.extend((key, value) for value in value_list)
-    # прикрепляем новые параметры
-    query_params.extend(
-        (key, value) for key, value in params_to_change.items()
+    return query_builder(context['request']).build(
+        params_to_remove, params_to_change
     )
-    return construct_query_string(context, query_params)
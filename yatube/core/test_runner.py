@@ -0,0 +1,28 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+# Кеш тестов: в памяти процесса, без общего файла узла
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    }
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кешем в памяти вместо SQLiteCache.
+
+    Иначе cache.clear() в тестах стирал бы кеш работающего сайта,
+    а записи с ключами из тестовой базы оставались бы в нем.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_settings = override_settings(CACHES=TEST_CACHES)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,75 @@
+import multiprocessing
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = Path(directory.name) / 'cache.sqlite3'
+        self.cache = SQLiteCache(self.location, {
+            'OPTIONS': {
+                'MAX_ENTRIES': 10, 'CULL_EVERY': 1, 'TOUCH_INTERVAL': 0,
+            },
+        })
+
+    def test_values_and_ttl(self):
+        """Значения сохраняются, истекают и не перезаписываются add."""
+        self.assertTrue(self.cache.add('key', {'value': 1}))
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.cache.set('expired', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 'value'))
+        self.cache.set_many({'a': 1, 'b': 'b'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'missing']), {'a': 1, 'b': 'b'}
+        )
+        self.cache.delete_many(['a', 'b'])
+        self.assertFalse(self.cache.has_key('a'))
+
+    def test_incr(self):
+        """incr атомарен, а отсутствующий ключ — ошибка."""
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.cache.set('big', 2 ** 70)
+        self.assertEqual(self.cache.incr('big'), 2 ** 70 + 1)
+
+    def test_cull_least_recently_used(self):
+        """При переполнении вытесняются давно не читанные ключи."""
+        self.cache.set('hot', 'value')
+        for i in range(20):
+            self.cache.set(f'key{i}', i)
+            self.cache.get('hot')
+        self.assertLessEqual(
+            len(self.cache.get_many(f'key{i}' for i in range(20))), 10
+        )
+        self.assertEqual(self.cache.get('hot'), 'value')
+
+    def test_shared_between_processes(self):
+        """Процессы видят общие значения и не теряют инкременты."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
@@ -0,0 +1,45 @@
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase
+
+from ..templatetags.utility_tags import query_builder
+
+
+class ModifyQueryTests(SimpleTestCase):
+
+    def render(self, request, source):
+        template = Template('{% load utility_tags %}' + source)
+        return template.render(Context({'request': request}))
+
+    def test_modify_query(self):
+        """Параметры заменяются на месте, удаляются и добавляются в конец,
+        пустые значения отбрасываются."""
+        request = RequestFactory().get(
+            '/', {'author': 'а б', 'page': '2', 'rating': ['1', '5'],
+                  'group': ''}
+        )
+        cases = {
+            "{% modify_query 'page' 'cursor' %}":
+                '/?author=%D0%B0+%D0%B1&amp;rating=1&amp;rating=5',
+            "{% modify_query 'page' rating=3 %}":
+                '/?author=%D0%B0+%D0%B1&amp;rating=3',
+            "{% modify_query 'page' 'author' cursor='x&y' %}":
+                '/?rating=1&amp;rating=5&amp;cursor=x%26y',
+            "{% modify_query page=3 %}":
+                '/?author=%D0%B0+%D0%B1&amp;page=3&amp;rating=1&amp;rating=5',
+            "{% modify_query 'page' 'author' 'rating' 'group' %}": '/',
+        }
+        for source, expected in cases.items():
+            with self.subTest(source=source):
+                self.assertEqual(self.render(request, source), expected)
+
+    def test_query_is_parsed_once(self):
+        """Разобранная строка запроса переиспользуется всеми ссылками."""
+        request = RequestFactory().get('/', {'author': '1'})
+        builder = query_builder(request)
+        self.render(
+            request,
+            "{% modify_query 'page' group=1 %}"
+            "{% modify_query 'page' group=2 %}"
+        )
+        self.assertIs(query_builder(request), builder)
+        self.assertEqual(len(builder.layouts), 1)
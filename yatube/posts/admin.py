@@ -1,24 +1,35 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post, Rating
+from .models import (Comment, FeedEntry, Follow, Group, ImageFile, Post,
+                     Profile, Rating)
+from .search import matching_posts
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
     """Представление модели поста в админке."""
 
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'image')
+    list_display = (
+        'pk', 'text', 'pub_date', 'author', 'group', 'image',
+        'rating_count', 'comment_count',
+    )
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE '%...%'."""
+        if not search_term:
+            return queryset, False
+        return matching_posts(search_term, queryset), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     """Представление модели группы в админке."""
 
-    list_display = ('title', 'slug', 'description')
+    list_display = ('title', 'slug', 'description', 'post_count')
     prepopulated_fields = {'slug': ('title',)}
     search_fields = ('description',)
     empty_value_display = '-пусто-'
@@ -49,3 +60,27 @@ class RatingAdmin(admin.ModelAdmin):
 
     list_display = ('pk', 'user', 'post', 'rating')
     list_editable = ('user', 'post', 'rating')
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    """Представление модели профиля в админке."""
+
+    list_display = ('pk', 'user', 'post_count')
+    search_fields = ('user__username',)
+
+
+@admin.register(ImageFile)
+class ImageFileAdmin(admin.ModelAdmin):
+    """Представление модели файла картинки в админке."""
+
+    list_display = ('pk', 'name', 'ref_count')
+    search_fields = ('name',)
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    """Представление модели записи ленты в админке."""
+
+    list_display = ('pk', 'user', 'post', 'author', 'pub_date')
+    list_filter = ('pub_date',)
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    """Восстанавливает триггеры поиска после пересоздания таблицы постов."""
+    from . import search
+    search.install(connections[using])
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
     verbose_name = 'Управление записями пользователей'
+
+    def ready(self):
+        # Обработчики, поддерживающие денормализованные счетчики
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search_index, sender=self)
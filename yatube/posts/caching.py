@@ -0,0 +1,358 @@
+import hashlib
+import math
+import random
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def version_key(name):
+    return f'posts:version:{name}'
+
+
+def modified_key(name):
+    return f'posts:modified:{name}'
+
+
+def get_version(name):
+    """Текущая версия пространства ключей кеша."""
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*names):
+    """Инвалидирует записи кеша, построенные на старых версиях."""
+    now = time.time()
+    for name in names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            get_version(name)
+    keys = [modified_key(name) for name in names]
+    stamps = cache.get_many(keys)
+    cache.set_many(
+        {key: max(stamps.get(key, 0), now) for key in keys}, None
+    )
+
+
+def get_or_add_many(defaults):
+    """Значения ключей кеша; отсутствующие заводятся из defaults."""
+    found = cache.get_many(defaults)
+    missing = {
+        key: value for key, value in defaults.items() if key not in found
+    }
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        found.update({**missing, **cache.get_many(missing)})
+    return found
+
+
+def cached(key, compute, timeout, version=None):
+    """Значение из кеша с защитой от одновременного пересчета."""
+    entry = cache.get(key)
+    if entry is None:
+        return refresh(key, compute, timeout, version, wait=True)
+    value, entry_version, expires, duration = entry
+    if entry_version == version and (
+        expires is None
+        or time.time() - duration * settings.CACHE_EARLY_BETA
+        * math.log(1 - random.random()) < expires
+    ):
+        return value
+    return refresh(key, compute, timeout, version, stale=value)
+
+
+def refresh(key, compute, timeout, version, stale=None, wait=False):
+    """Пересчитывает значение под блокировкой или отдает старое."""
+    lock = f'{key}:lock'
+    if cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            return recompute(key, compute, timeout, version)
+        finally:
+            cache.delete(lock)
+    if not wait:
+        return stale
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[1] == version:
+            return entry[0]
+    return recompute(key, compute, timeout, version)
+
+
+def recompute(key, compute, timeout, version):
+    started = time.monotonic()
+    value = compute()
+    duration = time.monotonic() - started
+    if timeout is None:
+        expires = cache_timeout = None
+    else:
+        expires = time.time() + timeout
+        cache_timeout = timeout + settings.CACHE_GRACE_PERIOD
+    cache.set(key, (value, version, expires, duration), cache_timeout)
+    return value
+
+
+def get_versions(names):
+    """Текущие версии нескольких пространств за один запрос к кешу."""
+    keys = {version_key(name): name for name in names}
+    found = get_or_add_many(dict.fromkeys(keys, time.time_ns()))
+    return {keys[key]: version for key, version in found.items()}
+
+
+# Кеши, для которых считаются попадания и промахи
+CACHE_STATS = ('cards', 'pages')
+
+
+def stats_key(name, hit):
+    return f'posts:stats:{name}:{"hit" if hit else "miss"}'
+
+
+def count_hit(name, hit, count=1):
+    """Учитывает count попаданий или промахов кеша name."""
+    if not count:
+        return
+    key = stats_key(name, hit)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        if not cache.add(key, count, None):
+            cache.incr(key, count)
+
+
+def cache_stats():
+    """Кол-во попаданий и промахов по каждому кешу из CACHE_STATS."""
+    keys = [stats_key(name, hit) for name in CACHE_STATS
+            for hit in (True, False)]
+    values = cache.get_many(keys)
+    return {
+        name: (
+            values.get(stats_key(name, True), 0),
+            values.get(stats_key(name, False), 0),
+        )
+        for name in CACHE_STATS
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many(
+        [stats_key(name, hit) for name in CACHE_STATS
+         for hit in (True, False)]
+    )
+
+
+def card_versions(post):
+    """Имена версий, от которых зависит карточка поста:
+    сам пост, бейдж автора и бейдж группы."""
+    names = [f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id is not None:
+        names.append(f'group:{post.group_id}')
+    return names
+
+
+def prefetch_card_versions(posts):
+    """Загружает версии карточек всей страницы одним запросом к кешу."""
+    posts = list(posts)
+    versions = get_versions(
+        {name for post in posts for name in card_versions(post)}
+    )
+    for post in posts:
+        post.card_versions = [
+            versions[name] for name in card_versions(post)
+        ]
+
+
+def card_key(post, *variant):
+    """Ключ карточки поста; меняется вместе с любой из ее версий."""
+    versions = getattr(post, 'card_versions', None)
+    if versions is None:
+        names = card_versions(post)
+        versions = [get_versions(names)[name] for name in names]
+    parts = (post.pk, post.author_id, post.group_id, *versions, *variant)
+    return 'posts:card:' + ':'.join(map(str, parts))
+
+
+def cached_fragments(name, keys, render, timeout):
+    """Фрагменты HTML по ключам: найденные в кеше и дорендеренные."""
+    found = cache.get_many(keys)
+    missing = {
+        key: render(item) for key, item in keys.items() if key not in found
+    }
+    count_hit(name, True, len(found))
+    count_hit(name, False, len(missing))
+    if missing:
+        cache.set_many(missing, timeout)
+    return {**found, **missing}
+
+
+def page_url(request):
+    """Путь и отсортированные непустые GET-параметры запроса."""
+    query = urlencode(sorted(
+        (key, value) for key, values in request.GET.lists()
+        for value in values if value
+    ))
+    return f'{request.path}?{query}'
+
+
+def page_state(request, namespaces, kwargs):
+    """Версии страницы и время ее последнего изменения."""
+    state = getattr(request, '_page_state', None)
+    if state is None:
+        names = ['pages', *namespaces(**kwargs)]
+        now = time.time()
+        found = get_or_add_many({
+            **{version_key(name): time.time_ns() for name in names},
+            **{modified_key(name): now for name in names},
+        })
+        versions = [found[version_key(name)] for name in names]
+        modified = min(max(found[modified_key(name)] for name in names), now)
+        state = request._page_state = (versions, modified)
+    return state
+
+
+def page_versions(request, namespaces, kwargs):
+    return page_state(request, namespaces, kwargs)[0]
+
+
+def page_key(request):
+    """Ключ страницы по ее адресу; версии хранятся в записи."""
+    url = hashlib.md5(page_url(request).encode()).hexdigest()
+    return f'posts:page:{url}'
+
+
+class Uncacheable(Exception):
+    """Ответ view нельзя кешировать, он отдается как есть."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def cacheable(request, response):
+    """Ответ не зависит от пользователя и может отдаваться всем."""
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def cache_anonymous_page(namespaces):
+    """Кеширует страницу целиком для анонимных пользователей."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (not settings.PAGE_CACHE_TIMEOUT
+                    or request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                response = view(request, *args, **kwargs)
+                return mark_page(response, 'BYPASS')
+            versions = tuple(page_versions(request, namespaces, kwargs))
+            rendered = []
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if not cacheable(request, response):
+                    raise Uncacheable(response)
+                rendered.append(response)
+                return {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'created': time.time(),
+                    'versions': versions,
+                }
+
+            try:
+                entry = cached(
+                    page_key(request), render,
+                    settings.PAGE_CACHE_TIMEOUT, version=versions,
+                )
+            except Uncacheable as error:
+                return mark_page(error.response, 'BYPASS')
+            count_hit('pages', not rendered)
+            if rendered:
+                return mark_page(rendered[0], 'MISS')
+            response = HttpResponse(
+                entry['content'], content_type=entry['content_type']
+            )
+            response['Age'] = int(time.time() - entry['created'])
+            if entry['versions'] != versions:
+                return mark_page(response, 'STALE')
+            return mark_page(response, 'HIT')
+        return wrapper
+    return decorator
+
+
+def mark_page(response, state):
+    """Выставляет заголовки кеширования по состоянию кеша страницы."""
+    response['X-Cache'] = state
+    patch_vary_headers(response, ('Cookie',))
+    if state == 'BYPASS':
+        patch_cache_control(response, private=True)
+    else:
+        # Страница сбрасывается записями, браузер перепроверяет ее
+        patch_cache_control(response, public=True, max_age=0)
+    return response
+
+
+def client_state(request):
+    """Пользователь, сессия и CSRF-токен клиента для ETag."""
+    user = request.user.pk if request.user.is_authenticated else 0
+    session = request.session.session_key or ''
+    return f'{user}:{session}:{request.META.get("CSRF_COOKIE", "")}'
+
+
+def conditional_page(namespaces):
+    """Отвечает 304 Not Modified по версиям страницы до вызова view."""
+    def etag(request, *args, **kwargs):
+        versions = page_versions(request, namespaces, kwargs)
+        source = f'{page_url(request)}:{client_state(request)}:{versions}'
+        return hashlib.md5(source.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if client_state(request) != '0::':
+            return None
+        modified = page_state(request, namespaces, kwargs)[1]
+        return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=last_modified
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Прежняя версия страницы не должна получить новый ETag
+            if (
+                response.status_code not in (200, 304)
+                or response.get('X-Cache') == 'STALE'
+            ):
+                del response['ETag']
+                del response['Last-Modified']
+            return response
+        return wrapper
+    return decorator
+
+
+def page_cache(namespaces):
+    """Условный GET и кеш страницы для анонимов по одним версиям."""
+    def decorator(view):
+        return conditional_page(namespaces)(
+            cache_anonymous_page(namespaces)(view)
+        )
+    return decorator
@@ -0,0 +1,207 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+
+from .models import (Comment, Follow, Group, ImageFile, Post, Profile,
+                     Rating, User)
+from .ranking import refresh_hot
+
+
+def shift(queryset, **deltas):
+    """Сдвигает счетчики выбранных записей на заданные величины."""
+    changes = {
+        field: (
+            models.F(field) + delta if delta > 0
+            else Greatest(models.F(field) + delta, 0)
+        )
+        for field, delta in deltas.items() if delta
+    }
+    if changes:
+        queryset.update(**changes)
+
+
+def shift_profile(user_id, **deltas):
+    """Сдвигает счетчики профиля пользователя."""
+    if user_id is None:
+        return
+    if any(delta > 0 for delta in deltas.values()):
+        Profile.objects.get_or_create(user_id=user_id)
+    shift(Profile.objects.filter(user_id=user_id), **deltas)
+
+
+def shift_author(user_id, delta):
+    """Сдвигает счетчик постов автора."""
+    shift_profile(user_id, post_count=delta)
+
+
+def shift_followers(user_id, delta):
+    """Сдвигает счетчик подписчиков автора."""
+    shift_profile(user_id, follower_count=delta)
+
+
+def shift_group(group_id, delta):
+    """Сдвигает счетчик постов группы."""
+    if group_id is not None:
+        shift(Group.objects.filter(pk=group_id), post_count=delta)
+
+
+def shift_image(name, delta):
+    """Сдвигает счетчик постов, ссылающихся на файл картинки.
+
+    Возвращает True, если ушла последняя ссылка: запись файла удалена,
+    и сам файл больше никому не нужен.
+    """
+    if not name or not delta:
+        return False
+    files = ImageFile.objects.filter(name=name)
+    if delta > 0:
+        # Сначала UPDATE: запись могла удалиться между проверкой
+        # и сдвигом, если бы она создавалась через get_or_create
+        if not files.update(ref_count=models.F('ref_count') + delta):
+            try:
+                with transaction.atomic():
+                    ImageFile.objects.create(name=name, ref_count=delta)
+            except IntegrityError:
+                files.update(ref_count=models.F('ref_count') + delta)
+        return False
+    shift(files, ref_count=delta)
+    deleted, _ = files.filter(ref_count=0).delete()
+    return bool(deleted)
+
+
+def shift_post(post_id, **deltas):
+    """Сдвигает счетчики рейтинга и комментариев поста.
+
+    При изменении оценок пересчитывает средний и округленный рейтинг,
+    после любого сдвига — популярность поста.
+    """
+    if post_id is None:
+        return
+    posts = Post.objects.filter(pk=post_id)
+    shift(posts, **deltas)
+    if deltas.keys() & {'rating_sum', 'rating_count'}:
+        posts.update(
+            rating_avg=rating_avg(),
+            rating_bucket=Round(rating_avg()),
+        )
+    if any(deltas.values()):
+        refresh_hot(post_id)
+
+
+def rating_avg():
+    """Средний рейтинг поста по сумме и кол-ву оценок."""
+    return models.ExpressionWrapper(
+        Cast('rating_sum', models.FloatField())
+        / NullIf('rating_count', 0),
+        output_field=models.FloatField()
+    )
+
+
+def aggregate(queryset, field, value, outer='pk', default=0):
+    """Коррелированный подзапрос с агрегатом по связанным записям."""
+    subquery = models.Subquery(
+        queryset
+        .filter(**{field: models.OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(value=value)
+        .values('value')
+    )
+    if default is None:
+        return subquery
+    return Coalesce(subquery, default)
+
+
+def actual_counters():
+    """Эталонные значения счетчиков для каждой модели."""
+    return (
+        (Post, {
+            'rating_sum': aggregate(
+                Rating.objects, 'post', models.Sum('rating')),
+            'rating_count': aggregate(
+                Rating.objects, 'post', models.Count('pk')),
+            'comment_count': aggregate(
+                Comment.objects, 'post', models.Count('pk')),
+            'rating_avg': aggregate(
+                Rating.objects, 'post',
+                models.Avg('rating', output_field=models.FloatField()),
+                default=None),
+            'rating_bucket': Round(aggregate(
+                Rating.objects, 'post',
+                models.Avg('rating', output_field=models.FloatField()),
+                default=None)),
+        }),
+        (Group, {
+            'post_count': aggregate(
+                Post.objects, 'group', models.Count('pk')),
+        }),
+        (ImageFile, {
+            'ref_count': aggregate(
+                Post.objects, 'image', models.Count('pk'), outer='name'),
+        }),
+        (Profile, {
+            'post_count': aggregate(
+                Post.objects, 'author', models.Count('pk'), outer='user'),
+            'follower_count': aggregate(
+                Follow.objects, 'author', models.Count('pk'), outer='user'),
+        }),
+    )
+
+
+def create_missing_profiles():
+    """Создает профили для авторов, у которых их еще нет."""
+    users = User.objects.filter(
+        models.Q(posts__isnull=False) | models.Q(following__isnull=False),
+        profile__isnull=True,
+    ).distinct().values_list('pk', flat=True)
+    profiles = Profile.objects.bulk_create(
+        Profile(user_id=user_id) for user_id in users
+    )
+    return len(profiles)
+
+
+def create_missing_image_files():
+    """Создает записи файлов для картинок постов, у которых их нет."""
+    names = (
+        Post.objects
+        .exclude(image='')
+        .exclude(image__in=ImageFile.objects.values('name'))
+        .values_list('image', flat=True)
+        .distinct()
+    )
+    files = ImageFile.objects.bulk_create(
+        ImageFile(name=name) for name in names
+    )
+    return len(files)
+
+
+def repair_counters(model, counters, batch_size):
+    """Пересчитывает счетчики пачками и исправляет расхождения.
+
+    Возвращает кол-во исправленных записей.
+    """
+    fixed = 0
+    last_pk = 0
+    actual = {f'actual_{field}': expr for field, expr in counters.items()}
+    while True:
+        batch = list(
+            model.objects
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', *counters)
+            .annotate(**actual)[:batch_size]
+        )
+        if not batch:
+            return fixed
+        last_pk = batch[-1].pk
+        drifted = [
+            obj.pk for obj in batch
+            if any(
+                getattr(obj, field) != getattr(obj, f'actual_{field}')
+                for field in counters
+            )
+        ]
+        if drifted:
+            # Пересчет внутри UPDATE не затирает параллельные изменения
+            with transaction.atomic():
+                model.objects.filter(pk__in=drifted).update(**counters)
+            fixed += len(drifted)
@@ -0,0 +1,194 @@
+import itertools
+from array import array
+from functools import partial
+
+from django.conf import settings
+from django.db import models, transaction
+
+from .caching import bump_version, cached, get_version
+from .following import contains, followed_authors
+from .models import FeedEntry, Follow, Post, Profile
+
+
+def batched(iterable, size):
+    """Разбивает итератор на пачки заданного размера."""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def insert_entries(rows):
+    """Добавляет записи (user_id, post_id, author_id, pub_date) в ленты."""
+    for batch in batched(rows, settings.FEED_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, post_id=post_id,
+                          author_id=author_id, pub_date=pub_date)
+                for user_id, post_id, author_id, pub_date in batch
+            ),
+            ignore_conflicts=True,
+        )
+
+
+def follower_count(author_id):
+    return (
+        Profile.objects
+        .filter(user_id=author_id)
+        .values_list('follower_count', flat=True)
+        .first()
+    ) or 0
+
+
+def is_pulled(author_id):
+    """Посты популярных авторов не рассылаются по лентам,
+    а подмешиваются при чтении."""
+    return follower_count(author_id) >= settings.FEED_PULL_THRESHOLD
+
+
+def pulled_authors():
+    """Отсортированные идентификаторы популярных авторов из кеша."""
+    threshold = settings.FEED_PULL_THRESHOLD
+    return cached(
+        f'posts:pulled:{threshold}',
+        lambda: array('q', (
+            Profile.objects
+            .filter(follower_count__gte=threshold)
+            .order_by('user_id')
+            .values_list('user_id', flat=True)
+        )),
+        None,
+        version=get_version('pulled'),
+    )
+
+
+def invalidate_pulled():
+    """Сбрасывает список популярных авторов после фиксации."""
+    transaction.on_commit(partial(bump_version, 'pulled'))
+
+
+def fan_out(post):
+    """Рассылает новый пост в ленты подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = (
+        Follow.objects
+        .filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+        .iterator()
+    )
+    insert_entries(
+        (user_id, post.pk, post.author_id, post.pub_date)
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора."""
+    if is_pulled(author_id):
+        return
+    posts = (
+        Post.objects
+        .filter(author_id=author_id)
+        .values_list('pk', 'pub_date')
+        .iterator()
+    )
+    insert_entries(
+        (user_id, post_id, author_id, pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты подписчика посты автора."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def followed(user_id, author_id):
+    """Обновляет ленты после новой подписки."""
+    followers = follower_count(author_id)
+    if followers == settings.FEED_PULL_THRESHOLD:
+        # Автор стал популярным: его посты подмешиваются при чтении
+        FeedEntry.objects.filter(author_id=author_id).delete()
+        invalidate_pulled()
+    elif followers < settings.FEED_PULL_THRESHOLD:
+        backfill(user_id, author_id)
+
+
+def unfollowed(user_id, author_id):
+    """Обновляет ленты после отписки."""
+    prune(user_id, author_id)
+    if follower_count(author_id) == settings.FEED_PULL_THRESHOLD - 1:
+        # Автор перестал быть популярным: раздаем его посты оставшимся
+        # подписчикам после фиксации, когда каскадные удаления завершены
+        transaction.on_commit(lambda: push_author(author_id))
+        invalidate_pulled()
+
+
+def push_author(author_id):
+    """Добавляет посты автора в ленты всех его подписчиков."""
+    followers = (
+        Follow.objects
+        .filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in followers.iterator():
+        backfill(user_id, author_id)
+
+
+def rebuild(user_id):
+    """Собирает ленту пользователя заново по его подпискам."""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    posts = (
+        Post.objects
+        .filter(author__following__user_id=user_id)
+        .exclude(
+            author__profile__follower_count__gte=(
+                settings.FEED_PULL_THRESHOLD
+            )
+        )
+        .values_list('pk', 'author_id', 'pub_date')
+        .iterator()
+    )
+    insert_entries(
+        (user_id, post_id, author_id, pub_date)
+        for post_id, author_id, pub_date in posts
+    )
+
+
+def feed_posts(user):
+    """Посты из ленты пользователя с ключом записи ленты для сортировки.
+
+    Сортировка по (feed_date, feed_post) совпадает с индексом
+    feed_user_pub_date_idx, поэтому лента читается без сортировки.
+    """
+    return Post.objects.filter(feed_entries__user=user).annotate(
+        feed_date=models.F('feed_entries__pub_date'),
+        feed_post=models.F('feed_entries__post'),
+    )
+
+
+def feed_sources(user):
+    """Выборки, которые сливаются в ленту подписок.
+
+    Первая — собственная лента пользователя, вторая — посты
+    популярных авторов, которые не рассылались по лентам, одной
+    выборкой по author_id IN (...). Подписки и популярные авторы
+    берутся из кеша, поэтому кол-во запросов не зависит от подписок.
+    """
+    authors = followed_authors(user.pk)
+    # Лента читается и при пустом массиве: записи в ней — из базы
+    pulled = authors and [
+        author_id for author_id in pulled_authors()
+        if contains(authors, author_id)
+    ]
+    sources = [feed_posts(user)]
+    if pulled:
+        sources.append(
+            Post.objects
+            .filter(author_id__in=pulled)
+            .annotate(
+                feed_date=models.F('pub_date'),
+                feed_post=models.F('pk'),
+            )
+        )
+    return sources
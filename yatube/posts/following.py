@@ -0,0 +1,79 @@
+"""Множество авторов, на которых подписан пользователь, в кеше."""
+import bisect
+import time
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import bump_version, get_version
+from .models import Follow
+
+
+def following_version(user_id):
+    return f'following:{user_id}'
+
+
+def following_key(user_id):
+    """Ключ массива подписок по текущей версии."""
+    version = get_version(following_version(user_id))
+    return f'posts:following:{user_id}:{version}'
+
+
+def load_following(user_id):
+    """Отсортированные идентификаторы авторов из базы."""
+    return array('q', (
+        Follow.objects
+        .filter(user_id=user_id)
+        .order_by('author_id')
+        .values_list('author_id', flat=True)
+    ))
+
+
+def followed_authors(user_id):
+    """Идентификаторы авторов, на которых подписан пользователь."""
+    key = following_key(user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = load_following(user_id)
+        cache.set(key, authors, settings.FOLLOWING_CACHE_TIMEOUT)
+    return authors
+
+
+def contains(authors, author_id):
+    """Есть ли автор в отсортированном массиве идентификаторов."""
+    position = bisect.bisect_left(authors, author_id)
+    return position < len(authors) and authors[position] == author_id
+
+
+def is_following(user_id, author_id):
+    return contains(followed_authors(user_id), author_id)
+
+
+def update_following(user_id, author_id, followed):
+    """Добавляет автора в массив подписок или убирает его оттуда."""
+    name = following_version(user_id)
+    lock = f'posts:following:{user_id}:lock'
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while not cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            # Массив загрузится из базы под новой версией
+            bump_version(name)
+            return
+        time.sleep(0.01)
+    try:
+        authors = cache.get(following_key(user_id))
+        bump_version(name)
+        if authors is None:
+            return
+        position = bisect.bisect_left(authors, author_id)
+        present = contains(authors, author_id)
+        if followed and not present:
+            authors.insert(position, author_id)
+        elif not followed and present:
+            del authors[position]
+        cache.set(
+            following_key(user_id), authors, settings.FOLLOWING_CACHE_TIMEOUT
+        )
+    finally:
+        cache.delete(lock)
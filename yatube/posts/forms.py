@@ -2,9 +2,10 @@ import itertools
 
 from django import forms
 from django.contrib.auth import get_user_model
-from django.db import models
 from django.forms import ModelForm
 
+from .caching import cached, get_version
+from .images import ingest_image
 from .models import RATING_CHOICES, Comment, Group, Post
 
 User = get_user_model()
@@ -13,14 +14,31 @@ SORTING_CHOICES = (
     ('-pub_date', 'дате публикации'),
     ('-rating_avg', 'рейтингу'),
     ('-comment_count', 'кол-ву комментариев'),
+    ('-hot_score', 'популярности'),
 )
 
 
+class IngestedImageField(forms.ImageField):
+    """Поле картинки, которое проверяет ее размер до декодирования.
+
+    В отличие от forms.ImageField, картинка не декодируется целиком
+    для проверки: в поле попадает уменьшенная копия без метаданных
+    (см. posts.images).
+    """
+
+    def to_python(self, data):
+        upload = forms.FileField.to_python(self, data)
+        if upload is None:
+            return None
+        return ingest_image(upload)
+
+
 class PostForm(ModelForm):
     """Форма добавления/редактирования постов."""
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': IngestedImageField}
         widgets = {
             'text': forms.Textarea(
                 attrs={'placeholder': 'Текст поста...'}
@@ -52,29 +70,50 @@ class RatingForm(forms.Form):
     )
 
 
-class AuthorModelChoiceField(forms.ModelChoiceField):
-    def label_from_instance(self, obj):
-        return obj.get_full_name() or obj.username
+def cached_choices(name, load):
+    """Список вариантов из кеша, пересчитываемый при смене версии."""
+    return cached(
+        f'posts:choices:{name}', load, None, version=get_version(name)
+    )
+
+
+def author_choices():
+    """Авторы, у которых есть посты."""
+    return cached_choices('authors', lambda: [
+        (user.pk, user.get_full_name() or user.username)
+        for user in User.objects.filter(
+            profile__post_count__gt=0
+        ).only('username', 'first_name', 'last_name').order_by('username')
+    ])
+
+
+def group_choices():
+    """Группы, в которых есть посты."""
+    return cached_choices('groups', lambda: list(
+        Group.objects.filter(post_count__gt=0).values_list('pk', 'title')
+    ))
 
 
 class PostFilterForm(forms.Form):
-    """Форма для фильтрации на главной странице."""
-    author = AuthorModelChoiceField(
+    """Форма для фильтрации на главной странице.
+
+    Варианты авторов и групп берутся из кеша, значения полей —
+    первичные ключи, поэтому проверка формы не обращается к базе.
+    """
+    author = forms.TypedChoiceField(
         label='Автор',
         required=False,
-        empty_label=None,
-        queryset=User.objects.annotate(
-            post_count=models.Count('posts')
-        ).filter(post_count__gt=0),
+        coerce=int,
+        empty_value=None,
+        choices=author_choices,
     )
 
-    group = forms.ModelChoiceField(
+    group = forms.TypedChoiceField(
         label='Группа',
         required=False,
-        empty_label=None,
-        queryset=Group.objects.annotate(
-            post_count=models.Count('posts')
-        ).filter(post_count__gt=0),
+        coerce=int,
+        empty_value=None,
+        choices=group_choices,
     )
 
     rating = forms.ChoiceField(
@@ -0,0 +1,244 @@
+"""Прием загруженных картинок постов с ограничением памяти."""
+import io
+import math
+import os
+import struct
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageCms, ImageOps
+
+# Формат хранения -> (имя в Pillow, расширение, параметры сохранения);
+# картинки прочих форматов сохраняются в PNG
+MASTER_FORMATS = {
+    'JPEG': ('JPEG', '.jpg', {'quality': 90, 'optimize': True}),
+    'PNG': ('PNG', '.png', {'optimize': True}),
+    'GIF': ('GIF', '.gif', {}),
+    'WEBP': ('WEBP', '.webp', {'quality': 90}),
+    'MPO': ('JPEG', '.jpg', {'quality': 90, 'optimize': True}),
+}
+
+# Форматы, которые декодер умеет читать сразу в уменьшенном масштабе
+DRAFT_FORMATS = {'JPEG', 'MPO'}
+
+# Масштабы, в которых декодирует JPEG libjpeg
+DRAFT_SCALES = (2, 4, 8)
+
+# Профиль, в который переводятся пиксели картинок с ICC-профилем
+SRGB_PROFILE = ImageCms.createProfile('sRGB')
+
+# Анимации хранятся как есть, из них вырезаются только метаданные;
+# кадры остальных многокадровых форматов (MPO, TIFF) отбрасываются,
+# кроме первого
+ANIMATION_FORMATS = {'GIF', 'PNG', 'WEBP'}
+
+# Фрагменты PNG с метаданными; цветовые профили остаются
+PNG_METADATA_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+# Фрагменты WebP с метаданными -> их флаг в заголовке VP8X
+WEBP_METADATA_CHUNKS = {b'EXIF': 0x08, b'XMP ': 0x04}
+
+# Расширения приложений GIF, которые нужны для показа: повтор
+# анимации и цветовой профиль
+GIF_APPLICATIONS = {b'NETSCAPE2.0', b'ANIMEXTS1.0', b'ICCRGBG1012'}
+
+
+def pixel_limit(format):
+    """Предел пикселей картинки с учетом формата."""
+    if format in DRAFT_FORMATS:
+        return settings.IMAGE_MAX_PIXELS
+    return min(settings.IMAGE_MAX_PIXELS, settings.IMAGE_MAX_DECODED_PIXELS)
+
+
+def ingest_image(upload):
+    """Проверяет загруженную картинку и готовит ее копию для хранения."""
+    try:
+        with Image.open(upload) as image:
+            # Пока прочитан только заголовок: размер известен без пикселей
+            width, height = image.size
+            limit = pixel_limit(image.format)
+            if width * height > limit:
+                raise ValidationError(
+                    'Картинка слишком большая: %(width)s×%(height)s, '
+                    'допустимо не больше %(limit)s пикселей.',
+                    code='too_many_pixels',
+                    params={
+                        'width': width,
+                        'height': height,
+                        'limit': limit,
+                    },
+                )
+            if (
+                getattr(image, 'is_animated', False)
+                and image.format in ANIMATION_FORMATS
+            ):
+                return keep_animation(upload, image)
+            source_format = image.format
+            master = decode_master(image, settings.IMAGE_MASTER_SIZE)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image'
+        ) from error
+    pillow_format, extension, params = MASTER_FORMATS.get(
+        source_format, MASTER_FORMATS['PNG']
+    )
+    if pillow_format == 'JPEG' and master.mode not in ('RGB', 'L'):
+        master = master.convert('RGB')
+    buffer = io.BytesIO()
+    master.save(buffer, pillow_format, **params)
+    stem, original_extension = os.path.splitext(upload.name)
+    if source_format not in MASTER_FORMATS:
+        original_extension = extension
+    return SimpleUploadedFile(
+        stem + original_extension,
+        buffer.getvalue(),
+        content_type=Image.MIME[pillow_format],
+    )
+
+
+def decode_master(image, max_size):
+    """Декодирует картинку, уменьшая ее до max_size без метаданных."""
+    size = (max_size, max_size)
+    if max(image.size) > max_size:
+        # Наименьший масштаб декодера JPEG, при котором картинка
+        # не больше max_size, но больше его половины; дальше уменьшает
+        # thumbnail. draft берет наибольший масштаб, при котором
+        # картинка не меньше запрошенной
+        scale = next(
+            (scale for scale in DRAFT_SCALES
+             if math.ceil(max(image.size) / scale) <= max_size),
+            DRAFT_SCALES[-1]
+        )
+        image.draft(None, (image.width // scale or 1,
+                           image.height // scale or 1))
+        # Для прочих форматов draft ничего не делает: thumbnail
+        # декодирует картинку целиком, reduce лишь ускоряет уменьшение
+        image.thumbnail(size, Image.LANCZOS, reducing_gap=2.0)
+    image.load()
+    # Ориентацию можно применить только после уменьшения: она меняет
+    # местами стороны, но не площадь
+    # На месте: без копии, если поворачивать не нужно
+    ImageOps.exif_transpose(image, in_place=True)
+    image = to_srgb(image)
+    # Из метаданных нужна только прозрачность палитровых картинок
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key == 'transparency'
+    }
+    return image
+
+
+def to_srgb(image):
+    """Переводит пиксели картинки из ее ICC-профиля в sRGB."""
+    icc = image.info.get('icc_profile')
+    if not icc:
+        return image
+    if image.mode == 'P':
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB'
+        )
+    try:
+        return ImageCms.profileToProfile(
+            image,
+            ImageCms.ImageCmsProfile(io.BytesIO(icc)),
+            SRGB_PROFILE,
+            outputMode='RGBA' if 'A' in image.getbands() else 'RGB',
+        )
+    except ImageCms.PyCMSError:
+        # Профиль поврежден или не подходит к пикселям:
+        # они остаются как есть
+        return image
+
+
+def keep_animation(upload, image):
+    """Анимация без метаданных, если она не больше IMAGE_MASTER_SIZE."""
+    if max(image.size) > settings.IMAGE_MASTER_SIZE:
+        raise ValidationError(
+            'Анимация слишком большая: допустимо не больше %(limit)s '
+            'пикселей по каждой стороне.',
+            code='animation_too_large',
+            params={'limit': settings.IMAGE_MASTER_SIZE},
+        )
+    strip = {'GIF': strip_gif, 'PNG': strip_png, 'WEBP': strip_webp}
+    upload.seek(0)
+    try:
+        data = strip[image.format](upload.read())
+    except (IndexError, struct.error) as error:
+        raise SyntaxError('Повреждена структура файла') from error
+    return SimpleUploadedFile(
+        upload.name, data, content_type=Image.MIME[image.format]
+    )
+
+
+def strip_png(data):
+    """PNG без фрагментов PNG_METADATA_CHUNKS."""
+    chunks = [data[:8]]
+    position = 8
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        end = position + length + 12
+        if kind not in PNG_METADATA_CHUNKS:
+            chunks.append(data[position:end])
+        position = end
+        if kind == b'IEND':
+            break
+    return b''.join(chunks)
+
+
+def strip_webp(data):
+    """WebP без фрагментов WEBP_METADATA_CHUNKS."""
+    chunks = [b'WEBP']
+    position = 12
+    riff_end = 8 + struct.unpack('<I', data[4:8])[0]
+    while position < riff_end:
+        kind, size = struct.unpack('<4sI', data[position:position + 8])
+        end = position + 8 + size + size % 2
+        chunk = data[position:end]
+        if kind == b'VP8X':
+            flags = chunk[8] & ~sum(WEBP_METADATA_CHUNKS.values())
+            chunk = chunk[:8] + bytes([flags]) + chunk[9:]
+        if kind not in WEBP_METADATA_CHUNKS:
+            chunks.append(chunk)
+        position = end
+    body = b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def strip_gif(data):
+    """GIF без комментариев и расширений приложений, кроме
+    GIF_APPLICATIONS."""
+    position = 13 + color_table_size(data[10])
+    blocks = [data[:position]]
+    while data[position] != 0x3B:
+        start = position
+        keep = True
+        if data[position] == 0x2C:
+            # Описание кадра, его палитра и сжатые пиксели
+            position += 11 + color_table_size(data[position + 9])
+        elif data[position] == 0x21:
+            label = data[position + 1]
+            keep = label != 0xFE and (
+                label != 0xFF
+                or data[position + 3:position + 14] in GIF_APPLICATIONS
+            )
+            position += 2
+        else:
+            raise SyntaxError('Неизвестный блок GIF')
+        position = skip_sub_blocks(data, position)
+        if keep:
+            blocks.append(data[start:position])
+    blocks.append(data[position:position + 1])
+    return b''.join(blocks)
+
+
+def color_table_size(flags):
+    """Размер палитры GIF в байтах по флагам блока."""
+    return 3 << ((flags & 0x07) + 1) if flags & 0x80 else 0
+
+
+def skip_sub_blocks(data, position):
+    """Позиция за цепочкой подблоков GIF."""
+    while data[position]:
+        position += data[position] + 1
+    return position + 1
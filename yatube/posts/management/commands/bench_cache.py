@@ -0,0 +1,118 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+def create_cache(backend, directory, max_entries):
+    params = {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': max_entries}}
+    if backend == 'locmem':
+        return LocMemCache('bench', params)
+    if backend == 'filebased':
+        return FileBasedCache(str(Path(directory) / 'files'), params)
+    return SQLiteCache(Path(directory) / 'cache.sqlite3', params)
+
+
+def work(backend, directory, options, barrier, results, seed):
+    """Чтение со сквозной записью и версиями, как у кешей постов."""
+    cache = create_cache(backend, directory, options['keys'] * 2)
+    rng = random.Random(seed)
+    payload = b'x' * options['value_size']
+    keys = options['keys']
+    hits = misses = 0
+    barrier.wait()
+    started = time.perf_counter()
+    for i in range(options['ops']):
+        if i % 10 == 0:
+            try:
+                cache.incr('version')
+            except ValueError:
+                cache.add('version', 1)
+        elif i % 10 == 1:
+            found = cache.get_many(
+                [f'key{rng.randrange(keys)}' for _ in range(10)]
+            )
+            hits += len(found)
+            misses += 10 - len(found)
+        else:
+            # Перекос к «горячим» ключам, как у популярных постов
+            key = f'key{int(keys * rng.random() ** 2)}'
+            if cache.get(key) is None:
+                misses += 1
+                cache.set(key, payload)
+            else:
+                hits += 1
+    results.put((time.perf_counter() - started, hits, misses))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кеша (locmem, файлы, SQLite) '
+        'под нагрузкой нескольких процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends', nargs='+',
+            default=['locmem', 'filebased', 'sqlite'],
+            choices=['locmem', 'filebased', 'sqlite'],
+            help='Проверяемые бэкенды',
+        )
+        parser.add_argument(
+            '--workers', nargs='+', type=int, default=[1, 4],
+            help='Кол-во параллельных процессов',
+        )
+        parser.add_argument(
+            '--ops', type=int, default=5000,
+            help='Кол-во операций в каждом процессе',
+        )
+        parser.add_argument(
+            '--keys', type=int, default=1000,
+            help='Кол-во различных ключей',
+        )
+        parser.add_argument(
+            '--value-size', type=int, default=2048,
+            help='Размер значения в байтах',
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        for workers in options['workers']:
+            for backend in options['backends']:
+                with tempfile.TemporaryDirectory() as directory:
+                    self.run(context, backend, directory, workers, options)
+
+    def run(self, context, backend, directory, workers, options):
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=work,
+                args=(backend, directory, options, barrier, results, seed),
+            )
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        measured = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = max(seconds for seconds, _, _ in measured)
+        hits = sum(hits for _, hits, _ in measured)
+        misses = sum(misses for _, _, misses in measured)
+        # Общий кеш видит инкременты версии из всех процессов
+        increments = workers * len(range(0, options['ops'], 10))
+        version = create_cache(backend, directory, 1).get('version')
+        self.stdout.write(
+            f'{backend:>9}, процессов {workers}: '
+            f'{workers * options["ops"] / elapsed:10.0f} опер./с, '
+            f'попаданий {hits / (hits + misses):6.1%}, '
+            f'версия {version or 0}/{increments}'
+        )
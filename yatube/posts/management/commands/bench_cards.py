@@ -0,0 +1,253 @@
+import os
+import tempfile
+import time
+
+from django import template
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine, Template
+from django.template.backends.django import get_installed_libraries
+from django.test import override_settings
+from django.utils import timezone
+
+from posts.caching import card_key, count_hit, prefetch_card_versions
+from posts.models import Group, Post
+
+User = get_user_model()
+
+PAGE_TEMPLATE = '{% load card_tags %}{% post_cards posts %}'
+
+# Карточки до тега post_cards: цикл с {% include %} и кешем
+# каждой карточки тегом {% cardcache %}
+LEGACY_PAGE_TEMPLATE = (
+    '{% for post in posts %}{% include card %}'
+    '{% if not forloop.last %}<hr>{% endif %}{% endfor %}'
+)
+LEGACY_CARD_TEMPLATE = '''{% load thumbnail %}
+{% load  user_filters %}
+{% load legacy_card_cache %}
+
+{% cardcache post %}
+<article>
+
+    <table style="width: 100%">
+        <colgroup>
+        <col style="width: 25%;">
+        <col style="width: 60%;">
+        <col style="width: 15%;">
+        </colgroup>
+        <tbody>
+            <tr>
+                <td>
+                    Дата публикации: {{ post.pub_date|date:'d E Y' }}
+                </td>
+                <td>
+                    Автор:
+                    <a class="btn btn-info btn-sm"
+                    href="{% url 'posts:profile' post.author.username %}"
+                    >
+                        {% if post.author.get_full_name %}
+                            {{ post.author.get_full_name }}
+                        {% else %}
+                            {{ post.author.username }}
+                        {% endif %}
+                        <span class="badge bg-danger">
+                            {{ post.author_count }}
+                        </span>
+                    </a>
+                </td>
+                <td>
+                    Рейтинг:
+                    <span class="badge rounded-pill bg-primary">
+                        {% with stars=post.rating_avg|getstars  %}
+                            {% include 'posts/includes/rating_stars.html' %}
+                        {% endwith %}
+                    </span>
+                </td>
+            </tr>
+        </tbody>
+    </table>
+
+    {% thumbnail post.image "960x339" crop="center" upscale=True as im %}
+        <img class="card-img my-2" src="{{ im.url }}">
+    {% endthumbnail %}
+    {% if post.search_snippet %}
+        <p>{{ post.search_snippet|highlight|linebreaksbr }}</p>
+    {% else %}
+        <p>{{ post.text|linebreaksbr}}</p>
+    {% endif %}
+
+    <div class="mb-5">
+        <a class="btn btn-primary btn-sm"
+        href="{% url 'posts:post_detail' post.id %}"
+        >
+            Подробнее
+        </a>
+        {% if not group and post.group %}
+            <a class="btn btn-info btn-sm"
+            href="{% url 'posts:group_list' post.group.slug %}"
+            >
+                #{{ post.group.title }}
+                <span class="badge bg-danger">{{ post.group_count }}</span>
+            </a>
+        {% endif %}
+        <button type="button" class="btn btn-sm btn-outline-dark" disabled>
+            Комментарии
+            <span class="badge bg-danger">{{ post.comment_count }}</span>
+        </button>
+    </div>
+
+</article>
+{% endcardcache %}'''
+
+# Библиотека с тегом {% cardcache %} для LEGACY_CARD_TEMPLATE
+register = template.Library()
+
+# Отдельный кеш, чтобы не трогать общий кеш сайта: в памяти
+# или во временном файле SQLite, как на сайте (см. core.cache)
+BENCH_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+
+
+class CardCacheNode(template.Node):
+
+    def __init__(self, nodelist, post):
+        self.nodelist = nodelist
+        self.post = post
+
+    def render(self, context):
+        post = self.post.resolve(context)
+        if getattr(post, 'search_snippet', None):
+            return self.nodelist.render(context)
+        key = card_key(post, int(bool(context.get('group'))))
+        html = cache.get(key)
+        count_hit('cards', html is not None)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, settings.POST_CARD_CACHE_TIMEOUT)
+        return html
+
+
+@register.tag
+def cardcache(parser, token):
+    """Прежний кеш одной карточки: {% cardcache post %}."""
+    bits = token.split_contents()
+    nodelist = parser.parse(('endcardcache',))
+    parser.delete_first_token()
+    return CardCacheNode(nodelist, parser.compile_filter(bits[1]))
+
+
+def legacy_engine():
+    """Движок шаблонов сайта с библиотекой прежнего тега."""
+    default = Engine.get_default()
+    return Engine(
+        dirs=default.dirs,
+        app_dirs=default.app_dirs,
+        libraries={
+            **get_installed_libraries(),
+            'legacy_card_cache': __name__,
+        },
+    )
+
+
+def bench_caches(backend, location):
+    return {
+        'default': {
+            'BACKEND': BENCH_BACKENDS[backend],
+            'LOCATION': location,
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        }
+    }
+
+
+def make_posts(count):
+    """Посты в памяти, как их возвращает query_posts, без базы."""
+    authors = [
+        User(pk=i, username=f'author{i}', first_name=f'Автор {i}')
+        for i in range(1, 21)
+    ]
+    groups = [
+        Group(pk=i, title=f'Группа {i}', slug=f'group-{i}')
+        for i in range(1, 6)
+    ]
+    posts = []
+    for i in range(1, count + 1):
+        post = Post(
+            pk=i,
+            text=f'Текст поста {i}\nвторая строка',
+            author=authors[i % len(authors)],
+            group=groups[i % len(groups)] if i % 3 else None,
+            pub_date=timezone.now(),
+            rating_avg=(i % 11) / 2 or None,
+            comment_count=i % 7,
+        )
+        post.author_count = 10
+        post.group_count = 20
+        posts.append(post)
+    return posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет рендеринг карточек постов тегом post_cards '
+        'и прежним циклом с {% include %}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cards', nargs='+', type=int, default=[10, 100, 1000],
+            help='Кол-во карточек на странице',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Кол-во повторов, берется лучшее время',
+        )
+        parser.add_argument(
+            '--backend', choices=BENCH_BACKENDS, default='sqlite',
+            help='Бэкенд кеша',
+        )
+
+    def handle(self, *args, **options):
+        template = Template(PAGE_TEMPLATE)
+        engine = legacy_engine()
+        legacy_page = engine.from_string(LEGACY_PAGE_TEMPLATE)
+        legacy_card = engine.from_string(LEGACY_CARD_TEMPLATE)
+        paths = {
+            'post_cards': lambda posts: template.render(
+                Context({'posts': posts})
+            ),
+            'include': lambda posts: legacy_page.render(
+                Context({'posts': posts, 'card': legacy_card})
+            ),
+        }
+        with tempfile.TemporaryDirectory() as folder, override_settings(
+            CACHES=bench_caches(
+                options['backend'], os.path.join(folder, 'cache.sqlite3')
+            )
+        ):
+            for count in options['cards']:
+                posts = make_posts(count)
+                prefetch_card_versions(posts)
+                for path, render in paths.items():
+                    for mode in ('cold', 'warm'):
+                        best = min(
+                            self.measure(render, posts, mode == 'cold')
+                            for _ in range(options['repeat'])
+                        )
+                        self.stdout.write(
+                            f'{count:>5} карточек, {path:>10}, {mode}: '
+                            f'{best * 1000:8.2f} мс, '
+                            f'{best / count * 1e6:7.1f} мкс/карточка'
+                        )
+
+    def measure(self, render, posts, cold):
+        """Время рендеринга страницы; cold — без карточек в кеше."""
+        if cold:
+            cache.clear()
+        started = time.perf_counter()
+        render(posts)
+        return time.perf_counter() - started
@@ -0,0 +1,109 @@
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feeds
+from posts.models import Follow, Post, User
+from posts.utils import CursorPaginator, query_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает чтение ленты подписок через JOIN по Follow '
+        'и через таблицу лент. Тестовые данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10, 1000, 10000],
+            help='Кол-во авторов, на которых подписан читатель',
+        )
+        parser.add_argument(
+            '--posts-per-author', type=int, default=3,
+            help='Кол-во постов у каждого автора',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Кол-во замеров для каждого варианта',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            readers = self.populate(
+                options['sizes'], options['posts_per_author']
+            )
+            for size, reader in readers:
+                join = self.measure(
+                    lambda: self.first_page(
+                        Post.objects.filter(author__following__user=reader),
+                        '-pub_date'
+                    ),
+                    options['repeat']
+                )
+                timeline = self.measure(
+                    lambda: self.first_page(
+                        feeds.feed_posts(reader), '-feed_date'
+                    ),
+                    options['repeat']
+                )
+                self.stdout.write(
+                    f'{size:>6} авторов: JOIN {join:8.2f} мс, '
+                    f'лента {timeline:8.2f} мс'
+                )
+            transaction.set_rollback(True)
+
+    def populate(self, sizes, posts_per_author):
+        prefix = uuid.uuid4().hex[:8]
+        User.objects.bulk_create(
+            (User(username=f'bench-{prefix}-author-{i}')
+             for i in range(max(sizes))),
+            batch_size=settings.FEED_BATCH_SIZE,
+        )
+        # SQLite не возвращает первичные ключи из bulk_create
+        authors = list(
+            User.objects
+            .filter(username__startswith=f'bench-{prefix}-author-')
+            .order_by('pk')
+        )
+        Post.objects.bulk_create(
+            (
+                Post(author=author, text=f'Тестовый пост {i}')
+                for author in authors
+                for i in range(posts_per_author)
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+        )
+        readers = []
+        for size in sizes:
+            reader = User.objects.create(
+                username=f'bench-{prefix}-reader-{size}'
+            )
+            Follow.objects.bulk_create(
+                (Follow(user=reader, author=author)
+                 for author in authors[:size]),
+                batch_size=settings.FEED_BATCH_SIZE,
+            )
+            feeds.rebuild(reader.pk)
+            readers.append((size, reader))
+        return readers
+
+    @staticmethod
+    def first_page(posts, ordering):
+        paginator = CursorPaginator(
+            query_posts(posts), settings.POSTS_PER_PAGE, ordering
+        )
+        return list(paginator.get_page())
+
+    @staticmethod
+    def measure(func, repeat):
+        """Медиана времени выполнения в миллисекундах."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
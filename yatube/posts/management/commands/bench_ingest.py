@@ -0,0 +1,104 @@
+import io
+import multiprocessing
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from posts.images import ingest_image
+
+
+# Формат в аргументах -> (имя в Pillow, параметры сохранения)
+BENCH_FORMATS = {
+    'jpeg': ('JPEG', {'quality': 90}),
+    'png': ('PNG', {}),
+}
+
+
+def make_image(megapixels, format):
+    """Картинка с градиентом заданного размера в пропорциях 4:3."""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    pillow_format, params = BENCH_FORMATS[format]
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **params)
+    return buffer.getvalue()
+
+
+def full_decode(content):
+    """Прежний путь: процесс миниатюр декодировал оригинал целиком."""
+    with Image.open(io.BytesIO(content)) as image:
+        ImageOps.exif_transpose(image).convert('RGB')
+
+
+def ingest(content):
+    ingest_image(SimpleUploadedFile('bench', content))
+
+
+def peak_rss(function, content):
+    """Прирост пикового RSS процесса за вызов, МБ;
+    None — картинка отклонена."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        function(content)
+    except ValidationError:
+        return None
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss — в килобайтах
+    return (after - before) / 1024
+
+
+def run_isolated(function, *args):
+    """Вызывает функцию в новом процессе: пик RSS не сбрасывается."""
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    ) as pool:
+        return pool.submit(function, *args).result()
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пиковую память при приеме загруженной картинки '
+        'для разных размеров JPEG и PNG'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--megapixels', nargs='+', type=float, default=[2, 12, 24, 40],
+            help='Размеры картинок, Мпикс.',
+        )
+        parser.add_argument(
+            '--formats', nargs='+', choices=BENCH_FORMATS,
+            default=list(BENCH_FORMATS), help='Форматы картинок',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"формат":>6} {"Мпикс.":>8} {"файл, МБ":>9} '
+            f'{"оригинал целиком, МБ":>21} {"ingest_image, МБ":>17}'
+        )
+        for format in options['formats']:
+            for megapixels in options['megapixels']:
+                # Картинка тоже готовится в отдельном процессе: в Linux
+                # пик RSS переходит к дочернему процессу и исказил бы
+                # замеры
+                content = run_isolated(make_image, megapixels, format)
+                full, ingested = (
+                    run_isolated(peak_rss, function, content)
+                    for function in (full_decode, ingest)
+                )
+                ingested = (
+                    'отклонена' if ingested is None else f'{ingested:.1f}'
+                )
+                self.stdout.write(
+                    f'{format:>6} {megapixels:>8g} '
+                    f'{len(content) / 2 ** 20:>9.1f} '
+                    f'{full:>21.1f} {ingested:>17}'
+                )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит кол-во попаданий и промахов кешей постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счетчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in cache_stats().items():
+            total = hits + misses
+            rate = hits / total if total else 0
+            self.stdout.write(
+                f'{name}: попаданий {hits}, промахов {misses}, '
+                f'доля попаданий {rate:.1%}'
+            )
+        if options['reset']:
+            reset_cache_stats()
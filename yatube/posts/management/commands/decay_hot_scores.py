@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.ranking import decay_hot
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярность постов с учетом прошедшего времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Кол-во постов, пересчитываемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        decayed = decay_hot(options['batch_size'])
+        self.stdout.write(f'Пересчитано постов: {decayed}')
@@ -0,0 +1,60 @@
+import itertools
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.feeds import batched
+from posts.models import Post
+from posts.thumbnails import create_pool, is_complete, make_thumbnails
+
+
+def make_batch(jobs, force):
+    """Нарезает миниатюры пачки постов в одном процессе пула."""
+    for post_id, image in jobs:
+        make_thumbnails(post_id, image, force)
+    return len(jobs)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нарезает недостающие миниатюры и их варианты для картинок постов '
+        '(существующие файлы не кодируются заново)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Нарезать заново миниатюры всех картинок',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Кол-во процессов (0 — в текущем процессе)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=20,
+            help='Кол-во постов в одной задаче процесса',
+        )
+
+    def handle(self, *args, **options):
+        posts = (
+            Post.objects
+            .exclude(image='')
+            .values_list('pk', 'image', 'thumbnails')
+            .iterator()
+        )
+        # Список собирается заранее: чтение базы не должно пересекаться
+        # с записью миниатюр из процессов пула. Картинка, общая для
+        # нескольких постов, нарезается один раз для всех
+        jobs = list({
+            image: (post_id, image)
+            for post_id, image, thumbnails in posts
+            if options['all'] or not is_complete(thumbnails)
+        }.values())
+        batches = batched(jobs, options['batch_size'])
+        force = itertools.repeat(options['all'])
+        if options['workers']:
+            with create_pool(options['workers']) as pool:
+                made = sum(pool.map(make_batch, batches, force))
+        else:
+            made = sum(map(make_batch, batches, force))
+        self.stdout.write(f'Нарезаны миниатюры картинок: {made}')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feeds
+from posts.models import FeedEntry, Follow, User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Имена пользователей (по умолчанию — все подписчики)',
+        )
+
+    def handle(self, *args, **options):
+        if options['usernames']:
+            user_ids = User.objects.filter(
+                username__in=options['usernames']
+            ).values_list('pk', flat=True)
+        else:
+            # Ленты пользователей без подписок тоже надо очистить
+            FeedEntry.objects.exclude(
+                user__in=Follow.objects.values('user')
+            ).delete()
+            user_ids = (
+                Follow.objects
+                .order_by('user_id')
+                .values_list('user_id', flat=True)
+                .distinct()
+            )
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                feeds.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
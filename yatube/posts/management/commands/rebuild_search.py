@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import SearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Заполняет полнотекстовый индекс постов заново'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(
+            f'Проиндексировано постов: {SearchIndex.objects.count()}'
+        )
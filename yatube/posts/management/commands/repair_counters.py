@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import bump_version
+from posts.counters import (actual_counters, create_missing_image_files,
+                            create_missing_profiles, repair_counters)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Кол-во записей, проверяемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        created = create_missing_profiles()
+        self.stdout.write(f'Создано профилей: {created}')
+        created = create_missing_image_files()
+        self.stdout.write(f'Создано записей файлов картинок: {created}')
+        for model, counters in actual_counters():
+            fixed = repair_counters(model, counters, options['batch_size'])
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}'
+            )
+        # Исправленные счетчики подписчиков меняют список популярных авторов
+        bump_version('pulled')
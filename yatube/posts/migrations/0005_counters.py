@@ -0,0 +1,91 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def aggregate(queryset, field, value):
+    """Коррелированный подзапрос с агрегатом по связанным записям."""
+    return Coalesce(
+        models.Subquery(
+            queryset
+            .filter(**{field: models.OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(value=value)
+            .values('value')
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Profile = apps.get_model('posts', 'Profile')
+    Rating = apps.get_model('posts', 'Rating')
+    Post.objects.update(
+        rating_sum=aggregate(Rating.objects, 'post', models.Sum('rating')),
+        rating_count=aggregate(Rating.objects, 'post', models.Count('pk')),
+        comment_count=aggregate(Comment.objects, 'post', models.Count('pk')),
+    )
+    Group.objects.update(
+        post_count=aggregate(Post.objects, 'group', models.Count('pk')),
+    )
+    Profile.objects.bulk_create(
+        Profile(user_id=author_id, post_count=post_count)
+        for author_id, post_count in (
+            Post.objects
+            .order_by()
+            .values('author')
+            .annotate(post_count=models.Count('pk'))
+            .values_list('author', 'post_count')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0004_alter_rating_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во комментариев'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во оценок'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во постов')),
+                ('user', models.OneToOneField(help_text='Введите имя пользователя', on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль',
+                'verbose_name_plural': 'Профили',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+
+def fill_follower_count(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Profile = apps.get_model('posts', 'Profile')
+    followers = (
+        Follow.objects
+        .order_by()
+        .values('author')
+        .annotate(follower_count=models.Count('pk'))
+        .values_list('author', 'follower_count')
+    )
+    for author_id, follower_count in followers:
+        Profile.objects.update_or_create(
+            user_id=author_id,
+            defaults={'follower_count': follower_count},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во подписчиков'),
+        ),
+        migrations.RunPython(fill_follower_count, migrations.RunPython.noop),
+    ]
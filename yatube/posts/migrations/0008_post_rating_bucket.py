@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_profile_follower_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='rating_avg',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating_bucket',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Округленный рейтинг'),
+        ),
+    ]
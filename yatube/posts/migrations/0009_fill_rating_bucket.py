@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models.functions import Cast, NullIf, Round
+
+BATCH_SIZE = 1000
+
+
+def fill_rating_bucket(apps, schema_editor):
+    """Заполняет средний и округленный рейтинг пачками по BATCH_SIZE."""
+    Post = apps.get_model('posts', 'Post')
+    average = models.ExpressionWrapper(
+        Cast('rating_sum', models.FloatField())
+        / NullIf('rating_count', 0),
+        output_field=models.FloatField()
+    )
+    rated = Post.objects.filter(rating_count__gt=0).order_by('pk')
+    last_pk = 0
+    while pks := list(
+        rated.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE]
+    ):
+        Post.objects.filter(pk__in=pks).update(
+            rating_avg=average,
+            rating_bucket=Round(average),
+        )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Каждая пачка фиксируется отдельно, чтобы не держать долгую блокировку
+    atomic = False
+
+    dependencies = [
+        ('posts', '0008_post_rating_bucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_rating_bucket, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:17
+
+import math
+
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+# Формула популярности и ее параметры на момент миграции;
+# актуальные — в posts.ranking и настройках HOT_*
+HOT_FIELDS = ('rating_sum', 'rating_count', 'comment_count', 'pub_date')
+WILSON_Z = 1.96
+RATING_LOW, RATING_HIGH = 1, 5
+HOT_GRAVITY = 1.8
+HOT_RATING_WEIGHT = 10.0
+HOT_COMMENT_WEIGHT = 5.0
+HOT_MAX_AGE_DAYS = 30
+
+
+def wilson_lower_bound(rating_sum, rating_count):
+    if not rating_count:
+        return 0.0
+    share = (
+        (rating_sum / rating_count - RATING_LOW) / (RATING_HIGH - RATING_LOW)
+    )
+    z2 = WILSON_Z ** 2
+    spread = WILSON_Z * math.sqrt(
+        share * (1 - share) / rating_count + z2 / (4 * rating_count ** 2)
+    )
+    return (
+        (share + z2 / (2 * rating_count) - spread) / (1 + z2 / rating_count)
+    )
+
+
+def hot_score(rating_sum, rating_count, comment_count, pub_date, now):
+    age = max((now - pub_date).total_seconds() / 3600, 0)
+    if age > HOT_MAX_AGE_DAYS * 24:
+        return 0.0
+    points = (
+        1
+        + HOT_RATING_WEIGHT * wilson_lower_bound(rating_sum, rating_count)
+        + HOT_COMMENT_WEIGHT * comment_count / (age + 2)
+    )
+    return points / (age + 2) ** HOT_GRAVITY
+
+
+def fill_hot_scores(apps, schema_editor):
+    """Считает популярность существующих постов пачками по BATCH_SIZE."""
+    Post = apps.get_model('posts', 'Post')
+    now = timezone.now()
+    posts = Post.objects.order_by('pk').only('pk', *HOT_FIELDS)
+    last_pk = 0
+    while batch := list(posts.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        for post in batch:
+            post.hot_score = hot_score(
+                **{field: getattr(post, field) for field in HOT_FIELDS},
+                now=now,
+            )
+        Post.objects.bulk_update(batch, ['hot_score'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hot_score'], name='post_hot_score_idx'),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+    ]
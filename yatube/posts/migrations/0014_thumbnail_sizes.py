@@ -0,0 +1,36 @@
+from django.core.files.storage import default_storage
+from django.db import migrations
+from PIL import Image
+
+
+def add_sizes(apps, schema_editor):
+    """Дополняет пути миниатюр их размерами; пропавшие файлы
+    отбрасываются и нарезаются заново командой make_thumbnails."""
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.exclude(thumbnails={}).only('thumbnails')
+    for post in posts.iterator():
+        thumbnails = {}
+        for name, path in post.thumbnails.items():
+            if isinstance(path, dict):
+                thumbnails[name] = path
+                continue
+            try:
+                with default_storage.open(path) as file:
+                    with Image.open(file) as image:
+                        width, height = image.size
+            except OSError:
+                continue
+            thumbnails[name] = {'path': path, 'width': width, 'height': height}
+        post.thumbnails = thumbnails
+        post.save(update_fields=['thumbnails'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_sizes, migrations.RunPython.noop),
+    ]
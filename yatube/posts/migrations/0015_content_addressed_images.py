@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:44
+
+from django.db import migrations, models
+import posts.storage
+
+
+def count_references(apps, schema_editor):
+    """Заводит записи файлов уже загруженных картинок. Старые файлы
+    сохраняют свои имена, по хешу именуются только новые загрузки."""
+    Post = apps.get_model('posts', 'Post')
+    ImageFile = apps.get_model('posts', 'ImageFile')
+    references = (
+        Post.objects
+        .exclude(image='')
+        .values('image')
+        .annotate(count=models.Count('pk'))
+        .order_by()
+    )
+    ImageFile.objects.bulk_create(
+        ImageFile(name=row['image'], ref_count=row['count'])
+        for row in references.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_thumbnail_sizes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Путь к файлу')),
+                ('ref_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Добавьте картинку', storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['follower_count'], name='profile_follower_count_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 # Модель данных пользователя поста
 User = get_user_model()
 
@@ -14,9 +16,32 @@ RATING_CHOICES = (
 )
 
 
-class Group(models.Model):
+class CountersModel(models.Model):
+    """Модель с денормализованными счетчиками.
+
+    Счетчики меняются только атомарными UPDATE, поэтому обычное
+    сохранение существующей записи их не перезаписывает.
+    """
+
+    counters = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counters
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersModel):
     """Модель группы постов."""
 
+    counters = ('post_count',)
+
     # Название группы
     title = models.CharField(
         max_length=200,
@@ -32,6 +57,12 @@ class Group(models.Model):
     )
     # Детальное описание группы
     description = models.TextField(verbose_name='Описание группы')
+    # Кол-во постов в группе (денормализованный счетчик)
+    post_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во постов'
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -42,9 +73,14 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(CountersModel):
     """Модель поста."""
 
+    counters = (
+        'rating_sum', 'rating_count', 'rating_avg', 'rating_bucket',
+        'comment_count', 'hot_score',
+    )
+
     # Текст поста
     text = models.TextField(
         verbose_name='Текст поста',
@@ -74,24 +110,117 @@ class Post(models.Model):
         help_text='Введите название группы'
     )
     # Поле для картинки (необязательное)
+    # Файлы именуются по содержимому и общие для постов (см. ImageFile)
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
+        db_index=True,
         verbose_name='Картинка',
         help_text='Добавьте картинку'
     )
+    # Пути и размеры готовых миниатюр картинки (см. posts.thumbnails)
+    thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюры'
+    )
+    # Денормализованные счетчики рейтинга и комментариев
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Сумма оценок'
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во оценок'
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во комментариев'
+    )
+    # Средний рейтинг и его округленное значение (для индексных выборок)
+    rating_avg = models.FloatField(
+        blank=True, null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Средний рейтинг'
+    )
+    rating_bucket = models.PositiveSmallIntegerField(
+        blank=True, null=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Округленный рейтинг'
+    )
+    # Популярность с затуханием по времени (см. posts.ranking)
+    hot_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность'
+    )
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-pub_date']
+        # Порядок (ключ, id) читается обратным проходом по индексу,
+        # т.к. id хранится в каждой записи индекса
+        indexes = [
+            models.Index(
+                fields=['pub_date'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['comment_count'],
+                name='post_comment_count_idx'
+            ),
+            models.Index(
+                fields=['hot_score'],
+                name='post_hot_score_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
-    def delete(self, *args, **kwargs):
-        self.image.delete(save=False)
-        super().delete(*args, **kwargs)
+
+class ImageFile(CountersModel):
+    """Файл картинки в хранилище и кол-во постов, которые на него ссылаются.
+
+    Файл и его миниатюры удаляются вместе с последней ссылкой
+    (см. posts.signals).
+    """
+
+    counters = ('ref_count',)
+
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Путь к файлу'
+    )
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self) -> str:
+        return self.name
 
 
 class Comment(models.Model):
@@ -129,6 +258,12 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -201,3 +336,151 @@ class Rating(models.Model):
                 name='unique_user_post'
             ),
         ]
+        indexes = [
+            # Покрывающий индекс для агрегатов оценок по посту
+            models.Index(
+                fields=['post', 'rating'],
+                name='rating_post_rating_idx'
+            ),
+        ]
+
+
+class Profile(CountersModel):
+    """Модель профиля пользователя со счетчиками."""
+
+    counters = ('post_count', 'follower_count')
+
+    # Связь с пользователем
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile',
+        verbose_name='Пользователь',
+        help_text='Введите имя пользователя'
+    )
+    # Кол-во постов пользователя (денормализованный счетчик)
+    post_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во постов'
+    )
+    # Кол-во подписчиков пользователя (денормализованный счетчик)
+    follower_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков'
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+        indexes = [
+            # Популярные авторы для ленты подписок (см. posts.feeds)
+            models.Index(
+                fields=['follower_count'],
+                name='profile_follower_count_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    """Модель записи в ленте подписок пользователя."""
+
+    # Пользователь, которому принадлежит лента
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+        help_text='Введите подписчика'
+    )
+    # Пост, попавший в ленту
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+        help_text='Введите номер поста'
+    )
+    # Автор поста (копия для быстрой очистки ленты при отписке)
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        help_text='Введите автора'
+    )
+    # Дата поста (копия для чтения ленты по индексу)
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        help_text='Введите дату публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_user_feed_post'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+
+class MatchLookup(models.Lookup):
+    """Полнотекстовый поиск по колонке FTS5: text__match='запрос'."""
+
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class SearchTextField(models.TextField):
+    """Текстовая колонка полнотекстового индекса."""
+
+
+SearchTextField.register_lookup(MatchLookup)
+
+
+class SearchIndex(models.Model):
+    """Полнотекстовый индекс FTS5 по текстам постов.
+
+    Таблица создается и поддерживается триггерами в posts.search,
+    модель нужна только для чтения через ORM.
+    """
+
+    # Пост, которому принадлежит запись индекса (rowid таблицы FTS5)
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+        verbose_name='Пост'
+    )
+    # Проиндексированный текст поста
+    text = SearchTextField(verbose_name='Текст поста')
+    # Релевантность bm25 (чем меньше, тем выше в выдаче)
+    rank = models.FloatField(verbose_name='Релевантность')
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
+        verbose_name = 'Поисковый индекс'
+        verbose_name_plural = 'Поисковый индекс'
@@ -0,0 +1,92 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import RATING_CHOICES, Post
+
+# Квантиль нормального распределения для 95% доверительного интервала
+WILSON_Z = 1.96
+
+# Поля поста, от которых зависит популярность
+HOT_FIELDS = ('rating_sum', 'rating_count', 'comment_count', 'pub_date')
+
+
+def wilson_lower_bound(rating_sum, rating_count):
+    """Нижняя граница интервала Уилсона для доли «положительных» оценок.
+
+    Оценка от 1 до 5 переводится в долю от 0 до 1, поэтому пост
+    с одной пятеркой оказывается ниже поста с сотней четверок.
+    """
+    if not rating_count:
+        return 0.0
+    low, high = RATING_CHOICES[0][0], RATING_CHOICES[-1][0]
+    share = (rating_sum / rating_count - low) / (high - low)
+    z2 = WILSON_Z ** 2
+    spread = WILSON_Z * math.sqrt(
+        share * (1 - share) / rating_count + z2 / (4 * rating_count ** 2)
+    )
+    return (
+        (share + z2 / (2 * rating_count) - spread) / (1 + z2 / rating_count)
+    )
+
+
+def hot_score(rating_sum, rating_count, comment_count, pub_date, now=None):
+    """Популярность поста с затуханием по времени.
+
+    Очки складываются из нижней границы Уилсона для оценок и скорости
+    комментирования (комментарии в час) и делятся на (возраст + 2) в
+    степени HOT_GRAVITY. Посты старше HOT_MAX_AGE_DAYS получают ноль.
+    """
+    now = now or timezone.now()
+    age = max((now - pub_date).total_seconds() / 3600, 0)
+    if age > settings.HOT_MAX_AGE_DAYS * 24:
+        return 0.0
+    points = (
+        1
+        + settings.HOT_RATING_WEIGHT
+        * wilson_lower_bound(rating_sum, rating_count)
+        + settings.HOT_COMMENT_WEIGHT * comment_count / (age + 2)
+    )
+    return points / (age + 2) ** settings.HOT_GRAVITY
+
+
+def refresh_hot(post_id):
+    """Пересчитывает популярность поста по текущим счетчикам."""
+    values = Post.objects.filter(pk=post_id).values(*HOT_FIELDS).first()
+    if values is not None:
+        Post.objects.filter(pk=post_id).update(hot_score=hot_score(**values))
+
+
+def decay_hot(batch_size, now=None):
+    """Пересчитывает популярность с учетом прошедшего времени.
+
+    Посты, которые уже выпали из популярных, не перебираются,
+    закешированные страницы главной сбрасываются.
+    Возвращает кол-во пересчитанных постов.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.HOT_MAX_AGE_DAYS)
+    posts = (
+        Post.objects
+        .exclude(hot_score=0, pub_date__lt=cutoff)
+        .order_by('pk')
+        .only('pk', 'hot_score', *HOT_FIELDS)
+    )
+    decayed = 0
+    last_pk = 0
+    while batch := list(posts.filter(pk__gt=last_pk)[:batch_size]):
+        last_pk = batch[-1].pk
+        for post in batch:
+            post.hot_score = hot_score(
+                **{field: getattr(post, field) for field in HOT_FIELDS},
+                now=now,
+            )
+        with transaction.atomic():
+            Post.objects.bulk_update(batch, ['hot_score'])
+        decayed += len(batch)
+    bump_version('page:index')
+    return decayed
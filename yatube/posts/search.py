@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection as default_connection
+from django.db import models
+from django.db.models.expressions import RawSQL
+
+from .models import Post, SearchIndex
+
+# Таблица FTS5 с внешним содержимым: тексты хранятся только в posts_post
+SEARCH_TABLE = SearchIndex._meta.db_table
+
+# Маркеры совпадений в сниппете, заменяются на <mark> после экранирования
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Кол-во слов в сниппете
+SNIPPET_TOKENS = 24
+
+SEARCH_SCHEMA = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+
+
+def install(connection=default_connection):
+    """Создает таблицу FTS5 и триггеры, если их еще нет.
+
+    Пересоздание posts_post миграциями SQLite удаляет триггеры,
+    поэтому функция вызывается и после каждого migrate.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for sql in SEARCH_SCHEMA:
+            cursor.execute(sql)
+
+
+def uninstall(connection=default_connection):
+    """Удаляет триггеры и таблицу FTS5."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for action in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{action}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def rebuild(connection=default_connection):
+    """Заполняет индекс заново по текущим текстам постов."""
+    if connection.vendor != 'sqlite':
+        return
+    install(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def match_query(query):
+    """Переводит пользовательский ввод в запрос FTS5.
+
+    Каждое слово берется в кавычки, поэтому операторы и спецсимволы
+    FTS5 не ломают запрос. Пустая строка означает, что искать нечего.
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+def matching_posts(query, queryset=Post.objects):
+    """Посты, текст которых совпадает с запросом."""
+    expression = match_query(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(search_index__text__match=expression)
+
+
+def search_posts(query, queryset=Post.objects):
+    """Найденные посты с релевантностью bm25 и сниппетом текста.
+
+    search_rank возрастает с падением релевантности, в search_snippet
+    совпадения обрамлены маркерами MATCH_START и MATCH_END.
+    """
+    return matching_posts(query, queryset).annotate(
+        search_rank=models.F('search_index__rank'),
+        search_snippet=RawSQL(
+            f'snippet({SEARCH_TABLE}, 0, %s, %s, %s, %s)',
+            (MATCH_START, MATCH_END, '…', SNIPPET_TOKENS),
+            output_field=models.TextField(),
+        ),
+    )
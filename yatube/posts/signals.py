@@ -0,0 +1,436 @@
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import feeds, following, ranking, storage, thumbnails
+from .caching import bump_version
+from .counters import (shift_author, shift_followers, shift_group,
+                       shift_image, shift_post)
+from .models import Comment, Follow, Group, Post, Rating, User
+
+
+# Посты, которые удаляются в текущем потоке вместе с их комментариями
+# и оценками
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+def remember(instance, fields, update_fields=None, raw=False):
+    """Запоминает значения полей, которые сейчас лежат в базе."""
+    instance._previous = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None:
+        meta = instance._meta
+        attnames = {meta.get_field(name).attname for name in update_fields}
+        if not attnames & set(fields):
+            return
+    instance._previous = (
+        type(instance).objects
+        .filter(pk=instance.pk)
+        .values(*fields)
+        .first()
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_post(sender, instance, update_fields=None, raw=False, **kwargs):
+    remember(instance, ('author_id', 'group_id', 'image'), update_fields, raw)
+    # Новый файл картинки сохранится вместе с постом и оставит заявку
+    instance._image_uploaded = (
+        bool(instance.image) and not instance.image._committed
+    )
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает счетчики постов автора и группы."""
+    if raw:
+        return
+    previous = (
+        {'author_id': None, 'group_id': None} if created
+        else instance._previous
+    )
+    if previous is None:
+        return
+    if previous['author_id'] != instance.author_id:
+        shift_author(previous['author_id'], -1)
+        shift_author(instance.author_id, 1)
+    if previous['group_id'] != instance.group_id:
+        shift_group(previous['group_id'], -1)
+        shift_group(instance.group_id, 1)
+
+
+@receiver(post_save, sender=Post)
+def deliver_post(sender, instance, created, raw=False, **kwargs):
+    """Рассылает пост в ленты подписчиков автора."""
+    if raw:
+        return
+    if not created:
+        previous = instance._previous
+        if previous is None or previous['author_id'] == instance.author_id:
+            return
+        instance.feed_entries.all().delete()
+    feeds.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def rank_post(sender, instance, created, raw=False, **kwargs):
+    """Сразу выставляет популярность новому посту."""
+    if created and not raw:
+        ranking.refresh_hot(instance.pk)
+
+
+def release_upload(instance):
+    """Снимает заявку на загруженный файл картинки, когда ссылка
+    на него зафиксирована (см. posts.storage)."""
+    if instance.__dict__.pop('_image_uploaded', False):
+        transaction.on_commit(
+            partial(storage.release_claim, instance.image.name)
+        )
+
+
+def release_image(image, stored):
+    """Снимает ссылку поста на картинку.
+
+    Файл картинки и ее миниатюры stored удаляются вместе с последней
+    ссылкой, после фиксации транзакции.
+    """
+    if shift_image(image, -1):
+        transaction.on_commit(lambda: thumbnails.delete_image(image, stored))
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, created, raw=False, **kwargs):
+    """Учитывает ссылку на новую картинку поста и отправляет ее
+    на нарезку миниатюр, если их еще нет у других постов."""
+    if raw:
+        return
+    image = instance.image.name
+    if not created:
+        previous = instance._previous
+        if previous is None or previous['image'] == image:
+            release_upload(instance)
+            return
+        # Миниатюры старой картинки больше не подходят
+        release_image(previous['image'], instance.thumbnails)
+    shift_image(image, 1)
+    release_upload(instance)
+    shared = image and thumbnails.shared_thumbnails(image, instance.pk)
+    instance.thumbnails = shared or {}
+    if shared or not created:
+        Post.objects.filter(pk=instance.pk).update(
+            thumbnails=instance.thumbnails
+        )
+    if image and not shared:
+        thumbnails.enqueue(instance.pk, image)
+
+
+@receiver(pre_delete, sender=Post)
+def mark_deleted_post(sender, instance, **kwargs):
+    """Отмечает удаляемый пост: его комментарии и оценки удаляются
+    каскадом, и править счетчики и кеши поста по каждой строке
+    незачем."""
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    shift_author(instance.author_id, -1)
+    shift_group(instance.group_id, -1)
+    release_image(instance.image.name, instance.thumbnails)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment(sender, instance, update_fields=None, raw=False,
+                     **kwargs):
+    remember(instance, ('post_id',), update_fields, raw)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает счетчик комментариев поста."""
+    if raw:
+        return
+    previous = (
+        {'post_id': None} if created
+        else instance._previous
+    )
+    if previous is None or previous['post_id'] == instance.post_id:
+        return
+    shift_post(previous['post_id'], comment_count=-1)
+    shift_post(instance.post_id, comment_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if instance.post_id not in deleting_posts():
+        shift_post(instance.post_id, comment_count=-1)
+
+
+@receiver(pre_save, sender=Rating)
+def remember_rating(sender, instance, update_fields=None, raw=False,
+                    **kwargs):
+    remember(instance, ('post_id', 'rating'), update_fields, raw)
+
+
+@receiver(post_save, sender=Rating)
+def count_rating(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает сумму и кол-во оценок поста."""
+    if raw:
+        return
+    previous = (
+        {'post_id': None, 'rating': 0} if created
+        else instance._previous
+    )
+    if previous is None:
+        return
+    if previous['post_id'] == instance.post_id:
+        shift_post(
+            instance.post_id,
+            rating_sum=instance.rating - previous['rating'],
+        )
+        return
+    shift_post(
+        previous['post_id'],
+        rating_sum=-previous['rating'],
+        rating_count=-1,
+    )
+    shift_post(
+        instance.post_id,
+        rating_sum=instance.rating,
+        rating_count=1,
+    )
+
+
+@receiver(post_delete, sender=Rating)
+def uncount_rating(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    shift_post(
+        instance.post_id,
+        rating_sum=-instance.rating,
+        rating_count=-1,
+    )
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed(sender, instance, created, raw=False, **kwargs):
+    """Добавляет посты автора в ленту нового подписчика."""
+    if created and not raw:
+        shift_followers(instance.author_id, 1)
+        transaction.on_commit(partial(
+            following.update_following,
+            instance.user_id, instance.author_id, True,
+        ))
+        feeds.followed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    shift_followers(instance.author_id, -1)
+    transaction.on_commit(partial(
+        following.update_following,
+        instance.user_id, instance.author_id, False,
+    ))
+    feeds.unfollowed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_choices(sender, instance, created, raw=False, **kwargs):
+    """Сбрасывает списки авторов и групп в фильтре главной страницы."""
+    if raw:
+        return
+    if created:
+        bump_version('authors', 'groups')
+        return
+    previous = instance._previous
+    if previous is None:
+        return
+    if previous['author_id'] != instance.author_id:
+        bump_version('authors')
+    if previous['group_id'] != instance.group_id:
+        bump_version('groups')
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_choices(sender, **kwargs):
+    bump_version('authors', 'groups')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_choices(sender, instance, created=False,
+                              update_fields=None, raw=False, **kwargs):
+    """Сбрасывает список авторов при изменении имени пользователя."""
+    names = {'username', 'first_name', 'last_name'}
+    if raw or (update_fields is not None and not names & set(update_fields)):
+        return
+    bump_version('authors', f'author:{instance.pk}')
+    if not created:
+        # Имя автора выводится на страницах всех разделов
+        bump_version('pages')
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_author_choices(sender, **kwargs):
+    bump_version('authors', 'pages')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_choices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_version('groups', f'group:{instance.pk}', 'pages')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_facets(sender, instance, raw=False, **kwargs):
+    """Сбрасывает закешированные счетчики фасетов."""
+    if raw or getattr(instance, 'post_id', None) in deleting_posts():
+        return
+    bump_version('posts')
+
+
+def badge_versions(author_id, group_id):
+    """Версии бейджей со счетчиками постов автора и группы."""
+    names = [f'author:{author_id}']
+    if group_id is not None:
+        names.append(f'group:{group_id}')
+    return names
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_card(sender, instance, created, raw=False, **kwargs):
+    """Сбрасывает закешированные карточки поста и бейджи его счетчиков."""
+    if raw:
+        return
+    if created:
+        bump_version(*badge_versions(instance.author_id, instance.group_id))
+        return
+    names = [f'post:{instance.pk}']
+    previous = instance._previous
+    if previous is not None and (
+        previous['author_id'] != instance.author_id
+        or previous['group_id'] != instance.group_id
+    ):
+        names += badge_versions(previous['author_id'], previous['group_id'])
+        names += badge_versions(instance.author_id, instance.group_id)
+    bump_version(*names)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_card(sender, instance, **kwargs):
+    bump_version(*badge_versions(instance.author_id, instance.group_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_rated_post_card(sender, instance, raw=False, **kwargs):
+    """Сбрасывает карточку поста при изменении оценок и комментариев."""
+    if raw or instance.post_id in deleting_posts():
+        return
+    names = {f'post:{instance.post_id}'}
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous['post_id'] is not None:
+        names.add(f'post:{previous["post_id"]}')
+    bump_version(*names)
+
+
+def post_pages(author_id, group_id):
+    """Версии страниц, на которых выводятся посты автора в группе."""
+    names = ['page:index']
+    username = (
+        User.objects
+        .filter(pk=author_id)
+        .values_list('username', flat=True)
+        .first()
+    )
+    if username is not None:
+        names.append(f'page:profile:{username}')
+    if group_id is not None:
+        slug = (
+            Group.objects
+            .filter(pk=group_id)
+            .values_list('slug', flat=True)
+            .first()
+        )
+        if slug is not None:
+            names.append(f'page:group:{slug}')
+    return names
+
+
+def rated_post_pages(post_id):
+    """Версии страниц, на которых выводятся счетчики поста."""
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'group_id'
+    ).first()
+    if post is None:
+        return []
+    return [f'page:post:{post_id}', *post_pages(**post)]
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_pages(sender, instance, created, raw=False, **kwargs):
+    """Сбрасывает закешированные страницы с постом."""
+    if raw:
+        return
+    names = {f'page:post:{instance.pk}'}
+    names.update(post_pages(instance.author_id, instance.group_id))
+    previous = instance._previous
+    if previous is not None:
+        names.update(post_pages(previous['author_id'], previous['group_id']))
+    bump_version(*names)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    bump_version(
+        f'page:post:{instance.pk}',
+        *post_pages(instance.author_id, instance.group_id)
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_rated_post_pages(sender, instance, raw=False, **kwargs):
+    """Сбрасывает страницы, на которых выводятся счетчики поста."""
+    if raw or instance.post_id in deleting_posts():
+        return
+    names = set(rated_post_pages(instance.post_id))
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous['post_id'] is not None:
+        names.update(rated_post_pages(previous['post_id']))
+    bump_version(*names)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, raw=False, **kwargs):
+    """Сбрасывает страницу профиля автора при подписке и отписке."""
+    if raw:
+        return
+    username = (
+        User.objects
+        .filter(pk=instance.author_id)
+        .values_list('username', flat=True)
+        .first()
+    )
+    if username is not None:
+        bump_version(f'page:profile:{username}')
@@ -0,0 +1,87 @@
+"""Хранилище картинок постов с именами по содержимому."""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Сколько держится заявка, если ссылку так и не зафиксировали (сек.)
+CLAIM_TIMEOUT = 60 * 10
+
+
+def content_name(name, content):
+    """Имя файла по хешу содержимого в папке исходного имени."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    digest = digest.hexdigest()
+    folder, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(folder, digest[:2], digest[2:4], digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое не записывает повторно тот же файл."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        with file_lock(name):
+            claim(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length)
+
+
+def claim_key(name):
+    return f'posts:image-claim:{name}'
+
+
+@contextmanager
+def file_lock(name):
+    """Блокировка файла; выдает False, если ее не удалось получить."""
+    lock = f'posts:image-lock:{name}'
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while not cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        cache.delete(lock)
+
+
+def claim(name):
+    """Отмечает загрузку файла, ссылка на который еще не зафиксирована."""
+    key = claim_key(name)
+    cache.add(key, 0, CLAIM_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Заявку успели вытеснить из кеша
+        cache.add(key, 1, CLAIM_TIMEOUT)
+
+
+def release_claim(name):
+    """Снимает заявку, когда ссылка на файл зафиксирована."""
+    try:
+        cache.decr(claim_key(name))
+    except ValueError:
+        pass
+
+
+def is_claimed(name):
+    return bool(cache.get(claim_key(name)))
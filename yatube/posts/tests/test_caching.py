@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+
+from ..caching import bump_version, cached
+from ..models import Post
+
+User = get_user_model()
+
+
+class StampedeTests(SimpleTestCase):
+
+    THREADS = 8
+
+    def setUp(self):
+        self.key = f'posts:test:{uuid.uuid4().hex}'
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.3)
+        return 'новое'
+
+    def run_concurrently(self):
+        """Одновременно запрашивает значение из нескольких потоков."""
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(cached(self.key, self.compute, 60))
+
+        threads = [
+            threading.Thread(target=worker) for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_recomputation_on_expiry(self):
+        """После истечения значение пересчитывает один поток,
+        остальные сразу получают устаревшее значение."""
+        cache.set(self.key, ('старое', None, time.time() - 1, 0.0), 60)
+        results = self.run_concurrently()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results.count('новое'), 1)
+        self.assertEqual(results.count('старое'), self.THREADS - 1)
+        self.assertEqual(cached(self.key, self.compute, 60), 'новое')
+        self.assertEqual(self.calls, 1)
+
+    def test_single_recomputation_on_cold_miss(self):
+        """Без значения в кеше потоки ждут единственный пересчет."""
+        results = self.run_concurrently()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['новое'] * self.THREADS)
+
+    def test_version_change_serves_stale(self):
+        """Смена версии запускает пересчет, как и истечение."""
+        cache.set(self.key, ('старое', 1, None, 0.0), 60)
+        self.assertEqual(cached(self.key, self.compute, None, 1), 'старое')
+        self.assertEqual(cached(self.key, self.compute, None, 2), 'новое')
+        self.assertEqual(self.calls, 1)
+
+    def test_early_recomputation(self):
+        """Долго считающееся значение пересчитывается до истечения."""
+        cache.set(self.key, ('старое', None, time.time() + 10, 0.0), 60)
+        self.assertEqual(cached(self.key, self.compute, 60), 'старое')
+        cache.set(self.key, ('старое', None, time.time() + 10, 1e6), 60)
+        self.assertEqual(cached(self.key, self.compute, 60), 'новое')
+
+
+class PageStampedeTests(TransactionTestCase):
+
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Тестовый пост')
+
+    def test_single_render_after_version_bump(self):
+        """После сброса главной страницы ее рендерит один запрос,
+        остальные анонимы получают прежнюю страницу."""
+        page = reverse('posts:index')
+        self.assertEqual(Client().get(page)['X-Cache'], 'MISS')
+        bump_version('page:index')
+        barrier = threading.Barrier(self.THREADS)
+        states = []
+
+        def worker():
+            barrier.wait()
+            try:
+                states.append(Client().get(page)['X-Cache'])
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker) for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(states.count('MISS'), 1)
+        self.assertLessEqual(set(states), {'MISS', 'STALE', 'HIT'})
+        response = Client().get(page)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertTrue(response.has_header('ETag'))
+
+
+class BenchCardsTests(SimpleTestCase):
+
+    def test_bench_cards_command(self):
+        """Команда bench_cards измеряет оба способа рендеринга карточек."""
+        output = StringIO()
+        call_command(
+            'bench_cards', cards=[2], repeat=1, backend='locmem',
+            stdout=output,
+        )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        for path in ('post_cards', 'include'):
+            with self.subTest(path=path):
+                self.assertEqual(
+                    sum(f' {path}, ' in line for line in lines), 2
+                )
@@ -1,14 +1,26 @@
 import shutil
+import struct
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.db.models import Q
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image, ImageCms
+from PIL.PngImagePlugin import PngInfo
 
-from ..models import Group, Post
+from ..forms import PostFilterForm
+from ..images import decode_master, ingest_image
+from ..models import Group, ImageFile, Post
+from ..storage import content_name, release_claim
 
 User = get_user_model()
 
@@ -16,6 +28,20 @@ User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def swapped_profile():
+    """ICC-профиль sRGB, в котором поменяны местами красный и синий."""
+    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+    icc = bytearray(profile.tobytes())
+    (count,) = struct.unpack('>I', icc[128:132])
+    tags = {bytes(icc[132 + 12 * i:136 + 12 * i]): 136 + 12 * i
+            for i in range(count)}
+    red, blue = tags[b'rXYZ'], tags[b'bXYZ']
+    icc[red:red + 8], icc[blue:blue + 8] = (
+        icc[blue:blue + 8], icc[red:red + 8]
+    )
+    return bytes(icc)
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTests(TestCase):
 
@@ -40,6 +66,11 @@ class PostFormTests(TestCase):
             b'\x00\x00\x01\x00\x01\x00\x00\x02'
             b'\x02\x4c\x01\x00\x3b'
         )
+        # Картинки хранятся под хешем содержимого после приема формой
+        cls.small_gif_name = content_name(
+            'posts/small.gif',
+            ingest_image(SimpleUploadedFile('small.gif', cls.small_gif)),
+        )
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=cls.small_gif,
@@ -57,6 +88,9 @@ class PostFormTests(TestCase):
         super().tearDownClass()
 
     def setUp(self):
+        # Заявки на файлы от постов из setUpClass не снимаются:
+        # их on_commit не выполняется
+        cache.clear()
         # Создаем авторизованый клиент
         self.authorized_client = Client()
         self.authorized_client.force_login(PostFormTests.author)
@@ -82,7 +116,7 @@ class PostFormTests(TestCase):
             Post.objects.filter(~Q(pk=PostFormTests.post.pk),
                                 text=PostFormTests.form_data['text'],
                                 group=PostFormTests.group,
-                                image='posts/small.gif',
+                                image=PostFormTests.small_gif_name,
                                 author=PostFormTests.author)
             .exists()
         )
@@ -114,7 +148,7 @@ class PostFormTests(TestCase):
             Post.objects.filter(pk=PostFormTests.post.pk,
                                 text=PostFormTests.form_data['text'],
                                 group=PostFormTests.group,
-                                image='posts/new.gif',
+                                image=PostFormTests.small_gif_name,
                                 author=PostFormTests.author)
             .exists()
         )
@@ -143,7 +177,7 @@ class PostFormTests(TestCase):
         self.assertFalse(
             Post.objects.filter(text='Тестовый пост для удаления',
                                 group=PostFormTests.group,
-                                image='posts/small.gif',
+                                image=post_to_delete.image.name,
                                 author=PostFormTests.author)
             .exists()
         )
@@ -167,3 +201,341 @@ class PostFormTests(TestCase):
                 author=PostFormTests.author)
             .exists()
         )
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnails_are_made_after_upload(self):
+        """Миниатюры нарезаются после сохранения поста,
+        до этого вместо них выводится заглушка."""
+        form_data = {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(
+                name='thumb.gif',
+                content=PostFormTests.small_gif,
+                content_type='image/gif'
+            ),
+        }
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.authorized_client.post(
+                reverse('posts:post_create'), data=form_data
+            )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertEqual(post.thumbnails, {})
+        page = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertContains(self.authorized_client.get(page),
+                            'src="data:image/svg+xml')
+        for callback in callbacks:
+            callback()
+        post.refresh_from_db()
+        self.assertEqual(set(post.thumbnails),
+                         set(settings.POST_THUMBNAILS))
+        response = self.authorized_client.get(page)
+        detail = post.thumbnails['detail']
+        self.assertContains(
+            response, f'src="{settings.MEDIA_URL}{detail["path"]}"'
+        )
+        self.assertContains(response, 'width="1" height="1"')
+        self.assertNotContains(response, 'data:image/svg+xml')
+
+    @override_settings(THUMBNAIL_WORKERS=0, THUMBNAIL_WIDTHS=(100, 200),
+                       THUMBNAIL_FORMATS=('webp', 'jpeg'))
+    def test_thumbnail_variants(self):
+        """Миниатюры нарезаются в нескольких ширинах и форматах,
+        make_thumbnails дополняет только неполные наборы."""
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'blue').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=PostFormTests.author,
+            text='Пост с большой картинкой',
+            image=SimpleUploadedFile('big.png', buffer.getvalue()),
+        )
+        call_command('make_thumbnails', stdout=StringIO())
+        post.refresh_from_db()
+        card = post.thumbnails['card']
+        self.assertEqual((card['width'], card['height']), (960, 339))
+        for format in ('webp', 'jpeg'):
+            self.assertEqual(
+                [width for width, _ in card['variants'][format]],
+                [100, 200, 960]
+            )
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, ' 200w, ')
+        output = StringIO()
+        call_command('make_thumbnails', stdout=output)
+        self.assertIn('Нарезаны миниатюры картинок: 0', output.getvalue())
+
+    @override_settings(THUMBNAIL_WORKERS=0, THUMBNAIL_WIDTHS=(100,),
+                       THUMBNAIL_FORMATS=('webp',))
+    def test_legacy_thumbnails_are_replaced(self):
+        """make_thumbnails удаляет прежний единственный JPEG миниатюры,
+        а JPEG нарезается, даже если его нет в THUMBNAIL_FORMATS."""
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'green').save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=PostFormTests.author,
+            text='Пост со старыми миниатюрами',
+            image=SimpleUploadedFile('old.png', buffer.getvalue()),
+        )
+        legacy = default_storage.save(
+            'thumbnails/legacy.jpg', ContentFile(b'jpeg')
+        )
+        Post.objects.filter(pk=post.pk).update(thumbnails={
+            'card': {'path': legacy, 'width': 300, 'height': 106},
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('make_thumbnails', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertFalse(default_storage.exists(legacy))
+        card = post.thumbnails['card']
+        self.assertEqual(set(card['variants']), {'webp', 'jpeg'})
+        self.assertEqual(card['path'], card['variants']['jpeg'][-1][1])
+        self.assertTrue(default_storage.exists(card['path']))
+
+    @override_settings(IMAGE_MASTER_SIZE=500)
+    def test_uploaded_image_is_downscaled(self):
+        """Загруженная картинка уменьшается до IMAGE_MASTER_SIZE,
+        поворачивается по EXIF и хранится без метаданных."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повернуть на 90° по часовой
+        exif[0x010F] = 'Камера'
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(
+            buffer, 'JPEG', exif=exif
+        )
+        form_data = {
+            'text': 'Пост с фото',
+            'image': SimpleUploadedFile(
+                'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+            ),
+        }
+        self.authorized_client.post(
+            reverse('posts:post_create'), data=form_data
+        )
+        post = Post.objects.get(text='Пост с фото')
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w\w/\w{64}\.jpg$')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (250, 500))
+            self.assertFalse(image.getexif())
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с общими миниатюрами,
+        файл удаляется вместе с последним ссылающимся постом."""
+        def upload(text):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.authorized_client.post(
+                    reverse('posts:post_create'),
+                    data={
+                        'text': text,
+                        'image': SimpleUploadedFile(
+                            f'{text}.gif', PostFormTests.small_gif
+                        ),
+                    },
+                )
+            return Post.objects.get(text=text)
+
+        first = upload('первый')
+        second = upload('второй')
+        name = PostFormTests.small_gif_name
+        self.assertEqual(first.image.name, name)
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(second.thumbnails, first.thumbnails)
+        self.assertEqual(ImageFile.objects.get(name=name).ref_count, 2)
+        storage = first.image.storage
+        thumbnail = first.thumbnails['card']['path']
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(storage.exists(thumbnail))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageFile.objects.filter(name=name).exists())
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(thumbnail))
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_delete_during_identical_upload(self):
+        """Файл не удаляется вместе с последней ссылкой, пока ссылку
+        повторной загрузки той же картинки еще не зафиксировали."""
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                author=PostFormTests.author,
+                text='Пост, который удалят',
+                image=SimpleUploadedFile('small.gif', PostFormTests.small_gif),
+            )
+        name = post.image.name
+        storage = post.image.storage
+        # Повторная загрузка: файл уже есть, ссылки на него пока нет
+        upload = SimpleUploadedFile('small.gif', PostFormTests.small_gif)
+        self.assertEqual(storage.save('posts/small.gif', upload), name)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertFalse(ImageFile.objects.filter(name=name).exists())
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                author=PostFormTests.author,
+                text='Пост с повторной загрузкой',
+                image=name,
+            )
+        release_claim(name)
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertFalse(storage.exists(name))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels(self):
+        """Картинка с лишними пикселями отклоняется без декодирования."""
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10)).save(buffer, 'PNG')
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Слишком большая картинка',
+                'image': SimpleUploadedFile('big.png', buffer.getvalue()),
+            },
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком большая: 20×10, '
+            'допустимо не больше 100 пикселей.'
+        )
+
+    @override_settings(IMAGE_MAX_DECODED_PIXELS=100)
+    def test_decoded_pixel_limit(self):
+        """Картинки, которые декодируются целиком, ограничены
+        IMAGE_MAX_DECODED_PIXELS, а JPEG — только IMAGE_MAX_PIXELS."""
+        images = {}
+        for format in ('PNG', 'JPEG'):
+            buffer = BytesIO()
+            Image.new('RGB', (20, 10)).save(buffer, format)
+            images[format] = SimpleUploadedFile('big', buffer.getvalue())
+        with self.assertRaisesMessage(
+            ValidationError, 'допустимо не больше 100 пикселей'
+        ):
+            ingest_image(images['PNG'])
+        self.assertEqual(
+            Image.open(ingest_image(images['JPEG'])).size, (20, 10)
+        )
+
+    def test_large_jpeg_is_decoded_reduced(self):
+        """JPEG на 12 Мпикс. декодируется сразу в масштабе 1/2,
+        а не целиком."""
+        buffer = BytesIO()
+        Image.new('RGB', (4000, 3000), 'red').save(buffer, 'JPEG')
+        with Image.open(buffer) as image:
+            master = decode_master(image, 2048)
+            self.assertEqual(image.decoderconfig[0], 2)
+        self.assertEqual(master.size, (2000, 1500))
+
+    def test_icc_profile_is_converted_to_srgb(self):
+        """Пиксели картинки переводятся из ее ICC-профиля в sRGB,
+        сам профиль не хранится."""
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(
+            buffer, 'JPEG', icc_profile=swapped_profile(), quality=95
+        )
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        with Image.open(ingest_image(upload)) as image:
+            self.assertNotIn('icc_profile', image.info)
+            red, _, blue = image.getpixel((4, 4))
+        self.assertLess(red, 10)
+        self.assertGreater(blue, 245)
+
+    def test_animation_metadata_is_stripped(self):
+        """Из анимаций вырезаются метаданные без пересборки кадров,
+        а из MPO остается только первый кадр."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        text = PngInfo()
+        text.add_text('Comment', 'Комментарий')
+        options = {
+            'GIF': {'comment': b'Comment'},
+            'PNG': {'exif': exif, 'pnginfo': text},
+            'WEBP': {'exif': exif},
+            'MPO': {'exif': exif},
+        }
+        frames = [Image.new('RGB', (10, 10), color)
+                  for color in ('red', 'blue')]
+        for format, params in options.items():
+            with self.subTest(format=format):
+                buffer = BytesIO()
+                frames[0].save(
+                    buffer, format, save_all=True,
+                    append_images=frames[1:], **params
+                )
+                upload = SimpleUploadedFile('animation', buffer.getvalue())
+                with Image.open(ingest_image(upload)) as image:
+                    self.assertEqual(
+                        getattr(image, 'n_frames', 1),
+                        1 if format == 'MPO' else 2
+                    )
+                    self.assertFalse(image.getexif())
+                    self.assertFalse(
+                        {'comment', 'Comment', 'exif'} & set(image.info)
+                    )
+
+
+class PostFilterFormTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост для проверки',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_choices_are_cached(self):
+        """Повторная проверка формы не обращается к базе."""
+        data = {
+            'author': PostFilterFormTests.author.pk,
+            'group': PostFilterFormTests.group.pk,
+        }
+        self.assertTrue(PostFilterForm(data=data).is_valid())
+        with self.assertNumQueries(0):
+            form = PostFilterForm(data=data)
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['group'],
+                         PostFilterFormTests.group.pk)
+
+    def test_choices_are_invalidated(self):
+        """Переименование группы и новая группа с постом
+        обновляют список вариантов."""
+        PostFilterForm().fields['group'].choices
+        PostFilterFormTests.group.title = 'Новое название'
+        PostFilterFormTests.group.save()
+        new_group = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test-slug-2',
+            description='Тестовое описание 2',
+        )
+        self.assertFalse(
+            PostFilterForm(data={'group': new_group.pk}).is_valid()
+        )
+        Post.objects.create(
+            author=PostFilterFormTests.author,
+            text='Пост в новой группе',
+            group=new_group,
+        )
+        self.assertEqual(
+            list(PostFilterForm().fields['group'].choices),
+            [(PostFilterFormTests.group.pk, 'Новое название'),
+             (new_group.pk, 'Тестовая группа 2')],
+        )
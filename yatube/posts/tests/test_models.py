@@ -1,10 +1,22 @@
+from datetime import timedelta
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Group, Post
+from ..models import Comment, Group, Post, Profile, Rating
+from ..ranking import wilson_lower_bound
 
 User = get_user_model()
 
+# Запросы при удалении поста с 200 комментариями и оценками: выборка
+# и удаление связанных записей (комментарии — двумя пачками), счетчики
+# автора и группы, адреса страниц автора и группы для сброса кеша
+DELETE_POST_QUERIES = 11
+
 
 class PostModelTest(TestCase):
 
@@ -73,3 +85,180 @@ class PostModelTest(TestCase):
         for model, expected_name in PostModelTest.model_titles.items():
             with self.subTest(model=model):
                 self.assertEqual(expected_name, str(model))
+
+
+class CountersTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test-slug-2',
+            description='Тестовое описание 2',
+        )
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            with self.subTest(obj=obj, field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_post_counters(self):
+        """Счетчики постов автора и группы следуют за постом."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+            group=CountersTest.group,
+        )
+        self.assertCounters(CountersTest.author.profile, post_count=1)
+        self.assertCounters(CountersTest.group, post_count=1)
+        post.group = CountersTest.other_group
+        post.save()
+        self.assertCounters(CountersTest.group, post_count=0)
+        self.assertCounters(CountersTest.other_group, post_count=1)
+        post.delete()
+        self.assertCounters(CountersTest.author.profile, post_count=0)
+        self.assertCounters(CountersTest.other_group, post_count=0)
+
+    def test_edit_form_moves_group_counters(self):
+        """Смена группы в форме редактирования переносит счетчик,
+        а сохранение группы со старыми счетчиками его не затирает."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+            group=CountersTest.group,
+        )
+        stale_group = Group.objects.get(pk=CountersTest.group.pk)
+        client = Client()
+        client.force_login(CountersTest.author)
+        client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Новый текст', 'group': CountersTest.other_group.pk},
+        )
+        self.assertCounters(CountersTest.group, post_count=0)
+        self.assertCounters(CountersTest.other_group, post_count=1)
+        stale_group.description = 'Новое описание'
+        stale_group.save()
+        self.assertCounters(CountersTest.group, post_count=0)
+
+    def test_rating_and_comment_counters(self):
+        """Счетчики рейтинга и комментариев следуют за записями."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        Rating.objects.create(
+            post=post, user=CountersTest.reader, rating=2
+        )
+        self.assertCounters(
+            post, rating_sum=2, rating_count=1, comment_count=1,
+            rating_avg=2.0, rating_bucket=2,
+        )
+        Rating.objects.update_or_create(
+            post=post, user=CountersTest.reader, defaults={'rating': 5}
+        )
+        Rating.objects.create(post=post, user=CountersTest.author, rating=2)
+        self.assertCounters(
+            post, rating_sum=7, rating_count=2,
+            rating_avg=3.5, rating_bucket=4,
+        )
+        post.ratings.all().delete()
+        post.comments.all().delete()
+        self.assertCounters(
+            post, rating_sum=0, rating_count=0, comment_count=0,
+            rating_avg=None, rating_bucket=None,
+        )
+
+    def test_delete_post_with_comments(self):
+        """Удаление поста не правит счетчики и кеши поста
+        по каждому комментарию и оценке."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+            group=CountersTest.group,
+        )
+        Comment.objects.bulk_create(
+            Comment(post=post, author=CountersTest.reader, text=str(i))
+            for i in range(200)
+        )
+        Rating.objects.create(post=post, user=CountersTest.reader, rating=4)
+        Rating.objects.create(post=post, user=CountersTest.author, rating=5)
+        with self.assertNumQueries(DELETE_POST_QUERIES):
+            post.delete()
+        self.assertFalse(Comment.objects.exists())
+        self.assertCounters(CountersTest.author.profile, post_count=0)
+        self.assertCounters(CountersTest.group, post_count=0)
+
+    def test_repair_counters_command(self):
+        """Команда repair_counters исправляет расхождения."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+            group=CountersTest.group,
+        )
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        Rating.objects.create(post=post, user=CountersTest.reader, rating=3)
+        Post.objects.filter(pk=post.pk).update(
+            comment_count=7, rating_bucket=None
+        )
+        Group.objects.filter(pk=CountersTest.group.pk).update(post_count=0)
+        Profile.objects.all().delete()
+        call_command('repair_counters', batch_size=1, stdout=StringIO())
+        self.assertCounters(post, comment_count=1, rating_bucket=3)
+        self.assertCounters(CountersTest.group, post_count=1)
+        self.assertEqual(
+            Profile.objects.get(user=CountersTest.author).post_count, 1
+        )
+
+    def test_hot_score(self):
+        """Популярность растет от оценок и комментариев
+        и затухает со временем."""
+        post = Post.objects.create(
+            author=CountersTest.author,
+            text='Тестовый пост',
+        )
+        post.refresh_from_db()
+        created = post.hot_score
+        self.assertGreater(created, 0)
+        Rating.objects.create(post=post, user=CountersTest.reader, rating=5)
+        post.refresh_from_db()
+        rated = post.hot_score
+        self.assertGreater(rated, created)
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        self.assertGreater(post.hot_score, rated)
+        commented = post.hot_score
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=2)
+        )
+        call_command('decay_hot_scores', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertLess(post.hot_score, commented)
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=365)
+        )
+        call_command('decay_hot_scores', stdout=StringIO())
+        self.assertCounters(post, hot_score=0)
+
+    def test_wilson_lower_bound(self):
+        """Много хороших оценок весят больше одной отличной."""
+        self.assertEqual(wilson_lower_bound(0, 0), 0)
+        self.assertGreater(
+            wilson_lower_bound(400, 100), wilson_lower_bound(5, 1)
+        )
+        self.assertLess(wilson_lower_bound(5, 1), 1)
@@ -0,0 +1,114 @@
+import re
+import unittest
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models
+from django.test import TestCase
+
+from ..feeds import feed_posts
+from ..forms import SORTING_CHOICES
+from ..models import Comment, Follow, Group, Post, Rating
+from ..utils import CursorPaginator, query_posts
+
+User = get_user_model()
+
+# Полный проход по таблице: SCAN без индекса
+FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)$')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite',
+                     'Планы запросов проверяются только для SQLite')
+class QueryPlanTests(TestCase):
+    """Основные запросы страниц читают строки по индексам.
+
+    План не должен содержать полного прохода по таблице
+    и временного B-дерева для сортировки.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Комментарий'
+        )
+        Rating.objects.create(post=cls.post, user=cls.user, rating=5)
+
+    def assertIndexedPlan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn('TEMP B-TREE', plan, plan)
+        for line in plan.splitlines():
+            self.assertIsNone(FULL_SCAN.search(line.strip()), plan)
+
+    def assertIndexedPages(self, queryset, ordering, tiebreak='pk'):
+        """Проверяет первую страницу и страницы по курсору в обе стороны."""
+        paginator = CursorPaginator(
+            queryset, settings.POSTS_PER_PAGE, ordering, tiebreak=tiebreak
+        )
+        post = paginator.object_list.first()
+        after = (getattr(post, paginator.key), getattr(post, tiebreak))
+        querysets = {
+            'first': paginator.object_list,
+            'next': paginator.order(
+                paginator.object_list.filter(paginator.seek(*after))
+            ),
+            'prev': paginator.order(
+                paginator.object_list.filter(paginator.seek(*after, True)),
+                True,
+            ),
+        }
+        for page, queryset in querysets.items():
+            with self.subTest(ordering=ordering, page=page):
+                self.assertIndexedPlan(
+                    queryset[:settings.POSTS_PER_PAGE + 1]
+                )
+
+    def test_index(self):
+        for ordering, _ in SORTING_CHOICES:
+            self.assertIndexedPages(query_posts(Post.objects.all()), ordering)
+
+    def test_group_list(self):
+        self.assertIndexedPages(
+            query_posts(self.group.posts.all()), '-pub_date'
+        )
+
+    def test_profile(self):
+        self.assertIndexedPages(
+            query_posts(self.author.posts.all()), '-pub_date'
+        )
+
+    def test_follow_index(self):
+        self.assertIndexedPages(
+            query_posts(feed_posts(self.user)), '-feed_date', 'feed_post'
+        )
+
+    def test_post_comments(self):
+        self.assertIndexedPages(
+            self.post.comments.select_related('author'), '-created'
+        )
+
+    def test_rating_aggregate(self):
+        self.assertIndexedPlan(
+            Rating.objects
+            .filter(post=self.post)
+            .values('post')
+            .annotate(total=models.Sum('rating'), count=models.Count('pk'))
+        )
+
+    def test_user_follows(self):
+        self.assertIndexedPlan(
+            Follow.objects.filter(user=self.user).values('author')
+        )
@@ -0,0 +1,323 @@
+"""Миниатюры картинок постов, которые готовятся после загрузки."""
+import hashlib
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import NamedTuple
+from urllib.parse import quote
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .models import ImageFile, Post
+from .storage import file_lock, is_claimed
+
+logger = logging.getLogger(__name__)
+
+# Папка миниатюр в хранилище
+THUMBNAIL_DIR = 'thumbnails'
+
+# Формат: (имя в Pillow, MIME-тип, параметры сохранения)
+IMAGE_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True,
+                                    'progressive': True}),
+}
+
+# Точка, вокруг которой обрезается картинка (параметр crop)
+CROP_CENTERING = {
+    'center': (0.5, 0.5),
+    'top': (0.5, 0.0),
+    'bottom': (0.5, 1.0),
+    'left': (0.0, 0.5),
+    'right': (1.0, 0.5),
+}
+
+# Высота заглушки для размеров, заданных только шириной
+PLACEHOLDER_RATIO = 9 / 16
+
+_executor = None
+
+
+class Thumbnail(NamedTuple):
+    """Миниатюра для тега <picture>."""
+    url: str
+    width: int
+    height: int
+    srcset: str = ''
+    sources: tuple = ()
+
+
+def executor():
+    """Пул процессов для нарезки, создается при первой задаче."""
+    global _executor
+    if _executor is None:
+        _executor = create_pool(settings.THUMBNAIL_WORKERS)
+    return _executor
+
+
+def create_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def enqueue(post_id, image):
+    """Ставит нарезку миниатюр картинки поста в очередь."""
+    def submit():
+        if not settings.THUMBNAIL_WORKERS:
+            make_thumbnails(post_id, image)
+            return
+        global _executor
+        try:
+            future = executor().submit(make_thumbnails, post_id, image)
+        except RuntimeError:
+            # Пул сломан (процесс упал): пересоздаем его для новых задач,
+            # пропущенные миниатюры нарежет make_thumbnails
+            logger.exception('Очередь миниатюр недоступна')
+            _executor = None
+            return
+        future.add_done_callback(report)
+
+    transaction.on_commit(submit)
+
+
+def report(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось нарезать миниатюры', exc_info=future.exception()
+        )
+
+
+def image_formats():
+    """Форматы из THUMBNAIL_FORMATS, которые умеет сохранять Pillow."""
+    formats = [
+        name for name in settings.THUMBNAIL_FORMATS
+        if name != 'jpeg' and features.check(name)
+    ]
+    return [*formats, 'jpeg']
+
+
+def variant_widths(width):
+    """Ширины вариантов миниатюры не больше ее собственной ширины."""
+    return sorted(
+        {size for size in settings.THUMBNAIL_WIDTHS if size < width}
+        | {width}
+    )
+
+
+def is_complete(thumbnails):
+    """Все ли миниатюры нарезаны во всех доступных форматах."""
+    formats = image_formats()
+    return all(
+        name in thumbnails
+        and all(
+            format in thumbnails[name].get('variants', {})
+            for format in formats
+        )
+        for name in settings.POST_THUMBNAILS
+    )
+
+
+def make_thumbnails(post_id, image, force=False):
+    """Нарезает миниатюры и сохраняет их во всех постах с картинкой."""
+    if not Post.objects.filter(pk=post_id, image=image).exists():
+        return
+    with default_storage.open(image) as file:
+        with Image.open(file) as source:
+            source = ImageOps.exif_transpose(source).convert('RGB')
+    thumbnails = {
+        name: save_variants(source, image, geometry, options, force)
+        for name, (geometry, options) in settings.POST_THUMBNAILS.items()
+    }
+    paths = thumbnail_paths(thumbnails)
+    stale = set()
+    with transaction.atomic():
+        for post in Post.objects.filter(image=image):
+            if post.thumbnails == thumbnails:
+                continue
+            # Файлы прежнего набора, например единственный JPEG
+            # до появления вариантов, больше никому не нужны: все посты
+            # с этой картинкой получают новый набор
+            stale |= thumbnail_paths(post.thumbnails) - paths
+            post.thumbnails = thumbnails
+            # Сохранение через модель сбрасывает кеш карточки и страниц
+            post.save(update_fields=['thumbnails'])
+        if stale:
+            transaction.on_commit(partial(delete_files, stale))
+
+
+def shared_thumbnails(image, post_id):
+    """Готовые миниатюры картинки из другого поста с ней же или None."""
+    stored = (
+        Post.objects
+        .filter(image=image)
+        .exclude(pk=post_id)
+        .values_list('thumbnails', flat=True)
+    )
+    return next(
+        (thumbnails for thumbnails in stored.iterator()
+         if thumbnails and is_complete(thumbnails)),
+        None
+    )
+
+
+def delete_image(image, thumbnails):
+    """Удаляет картинку и ее миниатюры, если они больше не нужны."""
+    with file_lock(image) as locked:
+        if (
+            not locked
+            or ImageFile.objects.filter(name=image).exists()
+            or is_claimed(image)
+        ):
+            return
+        delete_files({image} | thumbnail_paths(thumbnails))
+
+
+def thumbnail_paths(thumbnails):
+    """Пути всех файлов миниатюр из Post.thumbnails."""
+    paths = set()
+    for thumbnail in thumbnails.values():
+        paths.add(thumbnail['path'])
+        for variants in thumbnail.get('variants', {}).values():
+            paths.update(path for _, path in variants)
+    return paths
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def thumbnail_path(image, geometry, options, width, format):
+    """Путь варианта, однозначно заданный картинкой и размером."""
+    source = f'{image}:{geometry}:{sorted(options.items())}:{width}'
+    digest = hashlib.md5(source.encode()).hexdigest()
+    return f'{THUMBNAIL_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{format}'
+
+
+def save_variants(source, image, geometry, options, force=False):
+    """Сохраняет варианты миниатюры всех ширин и форматов."""
+    picture = resize(source, geometry, **options)
+    variants = {format: [] for format in image_formats()}
+    for width in variant_widths(picture.width):
+        paths = {
+            format: thumbnail_path(image, geometry, options, width, format)
+            for format in variants
+        }
+        missing = [
+            format for format, path in paths.items()
+            if force or not default_storage.exists(path)
+        ]
+        if missing:
+            scaled = picture
+            if width < picture.width:
+                height = round(picture.height * width / picture.width) or 1
+                scaled = picture.resize((width, height), Image.LANCZOS)
+            for format in missing:
+                save_image(scaled, paths[format], format)
+        for format, path in paths.items():
+            variants[format].append([width, path])
+    return {
+        'path': variants['jpeg'][-1][1],
+        'width': picture.width,
+        'height': picture.height,
+        'variants': variants,
+    }
+
+
+def save_image(picture, path, format):
+    pillow_format, _, params = IMAGE_FORMATS[format]
+    buffer = io.BytesIO()
+    picture.save(buffer, pillow_format, **params)
+    default_storage.delete(path)
+    default_storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def resize(picture, geometry, crop=None, upscale=False):
+    """Меняет размер как sorl: 'ШxВ' или только ширина 'Ш'."""
+    width, _, height = geometry.partition('x')
+    width = int(width)
+    height = int(height) if height else None
+    if height is None:
+        height = round(picture.height * width / picture.width) or 1
+        crop = None
+    if crop:
+        size = (width, height)
+        if not upscale:
+            size = (min(width, picture.width), min(height, picture.height))
+        return ImageOps.fit(picture, size, Image.LANCZOS,
+                            centering=CROP_CENTERING[crop])
+    scale = min(width / picture.width, height / picture.height)
+    if scale >= 1 and not upscale:
+        return picture.copy()
+    return picture.resize(
+        (round(picture.width * scale) or 1,
+         round(picture.height * scale) or 1),
+        Image.LANCZOS,
+    )
+
+
+def post_thumbnails(post):
+    """Миниатюры картинки поста по именам; неготовые — заглушки."""
+    thumbnails = {}
+    for name, (geometry, _) in settings.POST_THUMBNAILS.items():
+        stored = post.thumbnails.get(name)
+        if stored is None:
+            thumbnails[name] = placeholder(geometry)
+            continue
+        srcsets = {
+            format: ', '.join(
+                f'{default_storage.url(path)} {width}w'
+                for width, path in variants
+            )
+            for format, variants in stored.get('variants', {}).items()
+        }
+        thumbnails[name] = Thumbnail(
+            default_storage.url(stored['path']),
+            stored['width'],
+            stored['height'],
+            srcsets.pop('jpeg', ''),
+            tuple(
+                (IMAGE_FORMATS[format][1], srcset)
+                for format, srcset in srcsets.items()
+            ),
+        )
+    return thumbnails
+
+
+def prefetch_thumbnails(posts):
+    """Прикрепляет к постам страницы адреса и размеры миниатюр."""
+    for post in posts:
+        post.thumbnail_images = post_thumbnails(post) if post.image else {}
+
+
+def get_thumbnail(post, name):
+    """Миниатюра name поста, прикрепленная заранее или посчитанная."""
+    images = getattr(post, 'thumbnail_images', None)
+    if images is None:
+        images = post.thumbnail_images = post_thumbnails(post)
+    return images.get(name)
+
+
+@lru_cache(maxsize=None)
+def placeholder(geometry):
+    """Серый прямоугольник SVG с пропорциями миниатюры."""
+    width, _, height = geometry.partition('x')
+    width = int(width)
+    height = int(height) if height else round(width * PLACEHOLDER_RATIO)
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" '
+        f'viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+    )
+    return Thumbnail('data:image/svg+xml,' + quote(svg), width, height)
@@ -21,6 +21,12 @@ urlpatterns = [
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     # Создание записи
     path('create/', views.post_create, name='post_create'),
+    # Страница комментариев записи (фрагмент HTML)
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     # Комментарий
     path(
         'posts/<int:post_id>/comment/',
@@ -41,6 +47,8 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    # Поиск по текстам постов
+    path('search/', views.search, name='search'),
     # Поставить рейтинг посту
     path('posts/<int:post_id>/rate', views.rate_post, name='rate_post')
 ]
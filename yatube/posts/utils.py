@@ -1,18 +1,366 @@
+import base64
+import heapq
+import itertools
+import json
+import math
+from operator import attrgetter
+
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.db import models
-from django.db.models import FloatField
-from django.db.models.functions import Round
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connection, models, transaction
 
+from .caching import cached, get_version, prefetch_card_versions
 from .forms import SORTING_CHOICES
+from .models import Group, Post, Profile
+from .thumbnails import prefetch_thumbnails
+
+# Фасеты, для которых считается кол-во постов, и поля группировки
+FACET_FIELDS = {
+    'author': 'author_id',
+    'group': 'group_id',
+    'rating': 'rating_bucket',
+}
+
+
+class CursorPage(Page):
+    """Страница, найденная по курсору (sort_key, pk)."""
+
+    keyset = True
+
+    def __init__(self, object_list, number, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def is_int64(value):
+    """Целое (не float и не bool), которое SQLite примет как INTEGER."""
+    return type(value) is int and -2 ** 63 <= value < 2 ** 63
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор, который ищет страницу по ключу (sort_key, pk).
+
+    Выборка не материализуется: на страницу читается только
+    per_page + 1 строка. Старые ссылки вида ?page=N обслуживаются
+    через OFFSET, но номер страницы ограничен max_page.
+    COUNT(*) не выполняется, поэтому кол-во постов неизвестно.
+    """
+
+    count = None
+
+    def __init__(self, object_list, per_page, ordering='-pub_date',
+                 max_page=None, tiebreak='pk'):
+        self.key = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.tiebreak = tiebreak
+        self.max_page = max_page or settings.POSTS_MAX_OFFSET_PAGE
+        super().__init__(self.order(object_list), per_page)
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    def order(self, queryset, reverse=False):
+        """Сортирует выборку по (sort_key, tiebreak), NULL всегда в конце.
+
+        NULLS LAST/FIRST добавляется только для nullable-ключа,
+        иначе SQLite не может прочитать строки в порядке индекса.
+        """
+        key = models.F(self.key)
+        nulls = self.sort_field(queryset).null
+        if self.descending != reverse:
+            return queryset.order_by(
+                key.desc(nulls_last=nulls), f'-{self.tiebreak}'
+            )
+        return queryset.order_by(
+            key.asc(nulls_first=nulls), self.tiebreak
+        )
+
+    def seek(self, value, pk, reverse=False):
+        """Условие для строк, идущих после (value, pk) в порядке выборки."""
+        descending = self.descending != reverse
+        after = 'lt' if descending else 'gt'
+        if value is None:
+            condition = models.Q(
+                **{f'{self.key}__isnull': True,
+                   f'{self.tiebreak}__{after}': pk}
+            )
+            if not descending:
+                condition |= models.Q(**{f'{self.key}__isnull': False})
+            return condition
+        condition = (
+            models.Q(**{f'{self.key}__{after}': value})
+            | models.Q(**{self.key: value, f'{self.tiebreak}__{after}': pk})
+        )
+        if descending:
+            condition |= models.Q(**{f'{self.key}__isnull': True})
+        return condition
+
+    def sort_field(self, queryset=None):
+        """Поле модели или аннотации, по которому идет сортировка."""
+        if queryset is None:
+            queryset = self.object_list
+        annotation = queryset.query.annotations.get(self.key)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.key)
+
+    def encode(self, direction, number, obj):
+        value = getattr(obj, self.key)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        tiebreak = getattr(obj, self.tiebreak)
+        token = json.dumps([direction, number, value, tiebreak])
+        return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        token = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, number, value, pk = json.loads(token)
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        if not (is_int64(number) and number >= 1 and is_int64(pk)):
+            raise ValueError(cursor)
+        if value is not None:
+            value = self.sort_field().to_python(value)
+            if (
+                isinstance(value, float) and not math.isfinite(value)
+                or isinstance(value, int) and not is_int64(value)
+            ):
+                raise ValueError(value)
+        return direction, number, value, pk
+
+    def get_page(self, number=None, cursor=None):
+        """Возвращает страницу по курсору, а без него — по номеру."""
+        if cursor:
+            try:
+                page = self.seek_page(*self.decode(cursor))
+            except (TypeError, ValueError, OverflowError, ValidationError):
+                # Испорченный курсор: ошибки base64 и JSON — подклассы
+                # ValueError, неверное значение ключа — ValidationError
+                # или OverflowError
+                page = None
+            if page is not None:
+                return page
+        return self.offset_page(number)
+
+    def fetch(self, after=None, reverse=False, offset=0):
+        """Читает не больше per_page + 1 строки после ключа after."""
+        queryset = self.object_list
+        if after is not None:
+            queryset = self.order(
+                queryset.filter(self.seek(*after, reverse)), reverse
+            )
+        return list(queryset[offset:offset + self.per_page + 1])
+
+    def seek_page(self, direction, number, value, pk):
+        reverse = direction == 'prev'
+        rows = self.fetch((value, pk), reverse)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not rows:
+            return None
+        if reverse:
+            rows.reverse()
+            return self.make_page(rows, number, True, has_more)
+        return self.make_page(rows, number, has_more, True)
+
+    def offset_page(self, number):
+        try:
+            number = min(max(int(number), 1), self.max_page)
+        except (TypeError, ValueError):
+            number = 1
+        rows = self.fetch(offset=(number - 1) * self.per_page)
+        if not rows and number > 1:
+            return self.offset_page(1)
+        has_next = len(rows) > self.per_page
+        return self.make_page(rows[:self.per_page], number, has_next,
+                              number > 1)
+
+    def make_page(self, rows, number, has_next, has_previous):
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode('next', number + 1, rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode(
+                'prev', max(number - 1, 1), rows[0]
+            )
+        return CursorPage(rows, number, self, next_cursor, previous_cursor)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Пагинатор по курсору над несколькими выборками.
+
+    Каждая выборка отсортирована по (sort_key, pk) и читается не дальше
+    нужного кол-ва строк, затем потоки сливаются через heapq.merge.
+    Пост, попавший сразу в несколько выборок, выводится один раз.
+    """
+
+    def __init__(self, sources, per_page, ordering='-pub_date',
+                 max_page=None, tiebreak='pk'):
+        super().__init__(sources[0], per_page, ordering, max_page, tiebreak)
+        self.sources = [self.order(source) for source in sources]
+
+    def fetch(self, after=None, reverse=False, offset=0):
+        limit = offset + self.per_page + 1
+        streams = []
+        for source in self.sources:
+            if after is not None:
+                source = self.order(
+                    source.filter(self.seek(*after, reverse)), reverse
+                )
+            streams.append(source[:limit])
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (
+                getattr(post, self.key) is not None,
+                getattr(post, self.key),
+                getattr(post, self.tiebreak),
+            ),
+            reverse=self.descending != reverse,
+        )
+        unique = (
+            next(group)
+            for _, group in itertools.groupby(merged, key=attrgetter('pk'))
+        )
+        return list(itertools.islice(unique, offset, limit))
+
+
+class EstimatedPaginator(CursorPaginator):
+    """Пагинатор по курсору с приблизительным кол-вом постов.
+
+    Оценку передает вызывающий код: денормализованный счетчик
+    или статистика таблицы. Если выборка оказалась длиннее оценки,
+    оценка поднимается до уже увиденного кол-ва постов.
+    """
+
+    def __init__(self, object_list, per_page, ordering='-pub_date',
+                 max_page=None, tiebreak='pk', estimate=0):
+        super().__init__(object_list, per_page, ordering, max_page, tiebreak)
+        self.count = estimate
 
-FloatField.register_lookup(Round)
+    def make_page(self, rows, number, has_next, has_previous):
+        seen = (number - 1) * self.per_page + len(rows) + int(has_next)
+        self.count = max(self.count, seen)
+        return super().make_page(rows, number, has_next, has_previous)
+
+
+def estimate_table_rows(model):
+    """Оценивает кол-во строк таблицы без COUNT(*).
+
+    Берется статистика СУБД (ANALYZE), а если ее нет —
+    разница между крайними первичными ключами.
+    """
+    queries = {
+        'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+        'sqlite': 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+    }
+    row = None
+    if sql := queries.get(connection.vendor):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [model._meta.db_table])
+                row = cursor.fetchone()
+        except DatabaseError:
+            row = None
+    if row and (rows := int(float(str(row[0]).split()[0]))) > 0:
+        return rows
+    bounds = model.objects.aggregate(
+        low=models.Min('pk'), high=models.Max('pk')
+    )
+    if bounds['high'] is None:
+        return 0
+    return bounds['high'] - bounds['low'] + 1
 
 
-def get_page_obj(page_number, posts):
-    """Возвращает объект-пагинатор для постов."""
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
-    return paginator.get_page(page_number)
+def get_page_obj(request, posts, ordering=SORTING_CHOICES[0][0],
+                 estimate=None, tiebreak='pk'):
+    """Возвращает страницу постов по курсору или номеру страницы.
+
+    Режим пагинации выбирается по имени view в POSTS_PAGINATION;
+    estimate — функция, возвращающая приблизительное кол-во постов.
+    Список выборок posts сливается в одну ленту.
+    tiebreak — уникальное поле, упорядочивающее посты с равным ключом.
+    Версии закешированных карточек и миниатюры страницы загружаются сразу.
+    """
+    view_name = getattr(request.resolver_match, 'url_name', None)
+    mode = settings.POSTS_PAGINATION.get(view_name, 'keyset')
+    if isinstance(posts, (list, tuple)):
+        paginator = MergedCursorPaginator(
+            posts, settings.POSTS_PER_PAGE, ordering, tiebreak=tiebreak
+        )
+    elif mode == 'estimate' and estimate is not None:
+        paginator = EstimatedPaginator(
+            posts, settings.POSTS_PER_PAGE, ordering,
+            tiebreak=tiebreak, estimate=estimate()
+        )
+    else:
+        paginator = CursorPaginator(
+            posts, settings.POSTS_PER_PAGE, ordering, tiebreak=tiebreak
+        )
+    page = paginator.get_page(
+        request.GET.get('page'), request.GET.get('cursor')
+    )
+    prefetch_card_versions(page)
+    prefetch_thumbnails(page)
+    return page
+
+
+def get_comment_page(request, post):
+    """Возвращает страницу комментариев поста по курсору (created, pk).
+
+    Общее кол-во берется из счетчика comment_count без COUNT(*).
+    """
+    paginator = EstimatedPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        '-created',
+        estimate=post.comment_count,
+    )
+    return paginator.get_page(
+        request.GET.get('page'), request.GET.get('cursor')
+    )
+
+
+def estimate_posts(author=None, group=None):
+    """Приблизительное кол-во постов с учетом фильтров по автору и группе."""
+    estimates = [estimate_table_rows(Post)]
+    if author is not None:
+        estimates.append(author_post_count(author))
+    if group is not None:
+        estimates.append(
+            Group.objects
+            .filter(pk=group)
+            .values_list('post_count', flat=True)
+            .first() or 0
+        )
+    return min(estimates)
+
+
+def author_post_count(author):
+    """Кол-во постов автора из денормализованного счетчика."""
+    return (
+        Profile.objects
+        .filter(user=author)
+        .values_list('post_count', flat=True)
+        .first()
+    ) or 0
 
 
 def create_facets(form):
@@ -22,30 +370,72 @@ def create_facets(form):
         'categories': {}
     }
     for name, field in form.fields.items():
-        if name in ['rating', 'sorting']:
-            facets['categories'] |= {name: field.choices}
-        else:
-            facets['categories'] |= {name: tuple(
-                (items[0].value, items[1]) for items in field.choices
-            )}
+        facets['categories'] |= {name: tuple(field.choices)}
     return facets
 
 
+def count_facets(data):
+    """Кол-во постов для каждого значения фасетов автора, группы и рейтинга.
+
+    Для каждого фасета учитываются фильтры по остальным фасетам,
+    счетчики собираются одним запросом из сгруппированных агрегатов
+    и кешируются по нормализованному набору фильтров.
+    """
+    selected = {
+        name: int(getattr(value, 'pk', value)) if value else ''
+        for name in FACET_FIELDS
+        for value in (data.get(name),)
+    }
+    key = 'posts:facets:' + ':'.join(
+        str(selected[name]) for name in FACET_FIELDS
+    )
+    return cached(
+        key, lambda: load_facets(selected), settings.FACETS_CACHE_TIMEOUT,
+        version=get_version('posts'),
+    )
+
+
+def load_facets(selected):
+    """Считает фасеты одним запросом UNION ALL."""
+    base = Post.objects.order_by()
+    conditions = {
+        name: models.Q(**{FACET_FIELDS[name]: value})
+        for name, value in selected.items() if value
+    }
+    grouped = [
+        base
+        .filter(*(
+            condition for other, condition in conditions.items()
+            if other != name
+        ))
+        .values(value=models.F(field))
+        .annotate(
+            count=models.Count('pk'),
+            facet=models.Value(name, output_field=models.CharField()),
+        )
+        .values_list('facet', 'value', 'count')
+        for name, field in FACET_FIELDS.items()
+    ]
+    counts = {name: {} for name in FACET_FIELDS}
+    for name, value, count in grouped[0].union(*grouped[1:], all=True):
+        if value is not None:
+            counts[name][int(value)] = count
+    return counts
+
+
 def filter_facets(facets, posts, form):
     """Фильтрует посты в соответствии с формой."""
     for param, choices in facets['categories'].items():
         if value := form.cleaned_data[param]:
             if param == 'rating':
                 selected_value = int(value)
-                posts = (
-                    posts.filter(rating_avg__round=selected_value).distinct()
-                )
+                posts = posts.filter(rating_bucket=selected_value)
             elif param == 'sorting':
                 selected_value = value
                 posts = posts.order_by(value)
             else:
-                selected_value = value.pk
-                posts = posts.filter(**{param: value}).distinct()
+                selected_value = value
+                posts = posts.filter(**{param: value})
             facets['selected'][param] = (
                 selected_value,
                 dict(choices)[selected_value]
@@ -54,20 +444,11 @@ def filter_facets(facets, posts, form):
 
 
 def query_posts(queryset):
-    """Выборка постов со статистикой по кол-ву и рейтингу."""
-    subqueries = (
-        ('author_count', models.Count, 'author__posts'),
-        ('group_count', models.Count, 'group__posts'),
-        ('rating_avg', models.Avg, 'ratings__rating'),
-        ('rating_count', models.Count, 'ratings'),
-        ('comment_count', models.Count, 'comments'),
-    )
-    for agg_field, agg_fun, group in subqueries:
-        subquery = models.Subquery(
-            queryset
-            .filter(pk=models.OuterRef('pk'))
-            .annotate(**{agg_field: agg_fun(group)})
-            .values(agg_field)
-        )
-        queryset = queryset.annotate(**{agg_field: subquery})
-    return queryset.select_related('author', 'group')
+    """Выборка постов со статистикой по кол-ву и рейтингу.
+
+    Все значения читаются из денормализованных счетчиков.
+    """
+    return queryset.annotate(
+        author_count=models.F('author__profile__post_count'),
+        group_count=models.F('group__post_count'),
+    ).select_related('author', 'group')
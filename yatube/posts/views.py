@@ -8,9 +8,15 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views.generic import DeleteView
 
+from .caching import page_cache
+from .feeds import feed_sources
+from .following import is_following
 from .forms import CommentForm, PostFilterForm, PostForm, RatingForm
 from .models import Follow, Group, Post, Rating
-from .utils import create_facets, filter_facets, get_page_obj, query_posts
+from .search import search_posts
+from .utils import (author_post_count, count_facets, create_facets,
+                    estimate_posts, filter_facets, get_comment_page,
+                    get_page_obj, query_posts)
 
 User = get_user_model()
 
@@ -19,6 +25,7 @@ class LockedView(LoginRequiredMixin):
     login_url = 'users:login'
 
 
+@page_cache(lambda: ['page:index'])
 def index(request):
     """Главная страница с постами."""
 
@@ -27,7 +34,15 @@ def index(request):
     facets = create_facets(form)
     if form.is_valid():
         posts = filter_facets(facets, posts, form)
-    page_obj = get_page_obj(request.GET.get('page'), list(posts))
+    ordering, _ = facets['selected']['sorting']
+    filters = form.cleaned_data if form.is_valid() else {}
+    facets['counts'] = count_facets(filters)
+    page_obj = get_page_obj(
+        request, posts, ordering,
+        estimate=lambda: estimate_posts(
+            filters.get('author'), filters.get('group')
+        )
+    )
 
     context = {
         'form': form,
@@ -37,12 +52,15 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@page_cache(lambda slug: [f'page:group:{slug}'])
 def group_posts(request, slug):
     """Выборочные посты по группе."""
 
     group = get_object_or_404(Group, slug=slug)
     posts = query_posts(group.posts)
-    page_obj = get_page_obj(request.GET.get('page'), list(posts))
+    page_obj = get_page_obj(
+        request, posts, estimate=lambda: group.post_count
+    )
 
     context = {
         'group': group,
@@ -51,6 +69,7 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@page_cache(lambda username: [f'page:profile:{username}'])
 def profile(request, username):
     """Профиль пользователя."""
 
@@ -59,24 +78,41 @@ def profile(request, username):
     user = request.user
     following = (
         user.is_authenticated
-        and Follow.objects.filter(user=user, author=author).exists()
+        and is_following(user.pk, author.pk)
     )
-    page_obj = get_page_obj(request.GET.get('page'), list(posts))
+    post_count = author_post_count(author)
+    page_obj = get_page_obj(request, posts, estimate=lambda: post_count)
 
     context = {
         'author': author,
+        'post_count': post_count,
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    """Посты, найденные по тексту, в порядке релевантности."""
+
+    query = request.GET.get('q', '').strip()
+    posts = query_posts(search_posts(query))
+    page_obj = get_page_obj(request, posts, 'search_rank')
+
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@page_cache(lambda post_id: [f'page:post:{post_id}'])
 def post_detail(request, post_id):
     """Детальное описание поста."""
 
     queryset = query_posts(Post.objects)
     post = get_object_or_404(queryset, pk=post_id)
-    comments = post.comments.select_related('author')
+    comments = get_comment_page(request, post)
 
     context = {
         'post': post,
@@ -87,6 +123,19 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев без повторного вывода поста."""
+
+    queryset = Post.objects.only('pk', 'comment_count')
+    post = get_object_or_404(queryset, pk=post_id)
+
+    context = {
+        'post': post,
+        'comments': get_comment_page(request, post),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     """Создание нового поста."""
@@ -98,7 +147,8 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
         return redirect('posts:profile', username=request.user.username)
 
     context = {
@@ -126,7 +176,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         post = form.save(commit=False)
-        post.save(update_fields=['text', 'group', 'image'])
+        with transaction.atomic():
+            post.save(update_fields=['text', 'group', 'image'])
         return redirect('posts:post_detail', post_id=post_id)
 
     context = {
@@ -162,18 +213,16 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     """Посты, на которые подписан пользователь."""
-    followed_posts = Post.objects.filter(
-        author__following__user=request.user
-    )
-    posts = query_posts(followed_posts)
-    page_obj = get_page_obj(request.GET.get('page'), list(posts))
+    posts = [query_posts(source) for source in feed_sources(request.user)]
+    page_obj = get_page_obj(request, posts, '-feed_date', tiebreak='feed_post')
 
     context = {
         'page_obj': page_obj,
@@ -197,7 +246,8 @@ def profile_unfollow(request, username):
     """Дизлайк, отписка."""
     user = request.user
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=user, author=author).delete()
+    with transaction.atomic():
+        Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:profile', username=username)
 
 
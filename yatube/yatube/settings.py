@@ -125,6 +125,75 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Максимальное число выводимых постов
 POSTS_PER_PAGE: int = 10
+# Кол-во комментариев на одной странице поста
+COMMENTS_PER_PAGE: int = 20
+# Максимальный номер страницы для старых ссылок вида ?page=N
+POSTS_MAX_OFFSET_PAGE: int = 50
+# Режим пагинации лент по именам view: 'keyset' — только ссылки
+# вперед/назад, 'estimate' — еще и приблизительное кол-во страниц
+POSTS_PAGINATION: dict = {
+    'index': 'estimate',
+    'group_list': 'estimate',
+    'profile': 'estimate',
+    'follow_index': 'keyset',
+}
+# Размер пачки при записи постов в ленты подписчиков
+FEED_BATCH_SIZE: int = 1000
+# Посты авторов с таким кол-вом подписчиков не рассылаются по лентам,
+# а подмешиваются при чтении ленты
+FEED_PULL_THRESHOLD: int = 1000
+# Время жизни закешированных подписок пользователя: подписка и отписка
+# правят их на месте, срок лишь ограничивает возможное расхождение
+FOLLOWING_CACHE_TIMEOUT: int = 60 * 60 * 24
+
+# Время жизни закешированных счетчиков фасетов на главной странице
+FACETS_CACHE_TIMEOUT: int = 300
+
+# Защита от одновременного пересчета закешированных значений:
+# сколько еще отдавать устаревшее значение, пока его пересчитывают (сек.),
+# сколько держать блокировку пересчета (сек.) и насколько заранее
+# пересчитывать значение (1.0 — стандартная для XFetch настройка)
+CACHE_GRACE_PERIOD: int = 60
+CACHE_LOCK_TIMEOUT: int = 10
+CACHE_EARLY_BETA: float = 1.0
+
+# Время жизни закешированных карточек постов (ключи версионируются)
+POST_CARD_CACHE_TIMEOUT: int = 60 * 60 * 24
+
+# Время жизни закешированных страниц для анонимных пользователей
+PAGE_CACHE_TIMEOUT: int = 60 * 10
+
+# Миниатюры картинок постов: имя -> (геометрия, параметры sorl)
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'detail': ('960', {}),
+}
+# Ширины вариантов каждой миниатюры для srcset и их форматы в порядке
+# предпочтения; AVIF и WebP нарезаются, если их поддерживает Pillow,
+# JPEG — всегда
+THUMBNAIL_WIDTHS = (480, 720, 960)
+THUMBNAIL_FORMATS = ('avif', 'webp', 'jpeg')
+# Кол-во процессов, нарезающих миниатюры после загрузки
+# (0 — нарезать в процессе, сохранившем пост)
+THUMBNAIL_WORKERS: int = 1
+
+# Загруженные картинки: больше IMAGE_MAX_PIXELS пикселей отклоняются
+# до декодирования, хранится копия не больше IMAGE_MASTER_SIZE
+# по большей стороне. JPEG декодируется в масштабе 1/2–1/8, и копия
+# большого JPEG может быть меньше, но больше IMAGE_MASTER_SIZE / 2.
+# Не-JPEG декодируются целиком, поэтому для них предел
+# IMAGE_MAX_DECODED_PIXELS (16 Мпикс. RGBA — 64 МБ растра)
+IMAGE_MAX_PIXELS: int = 40_000_000
+IMAGE_MAX_DECODED_PIXELS: int = 16_000_000
+IMAGE_MASTER_SIZE: int = 2048
+
+# Сортировка по популярности: очки поста делятся на (возраст + 2) ** GRAVITY
+HOT_GRAVITY: float = 1.8
+# Вес нижней границы Уилсона для оценок и скорости комментирования
+HOT_RATING_WEIGHT: float = 10.0
+HOT_COMMENT_WEIGHT: float = 5.0
+# Посты старше этого срока (в днях) выпадают из популярных
+HOT_MAX_AGE_DAYS: int = 30
 
 # Собственная система авторизации пользователей
 LOGIN_URL = 'users:login'
@@ -140,10 +209,18 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Кеш в файле SQLite общий для всех воркеров узла (см. core.cache)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+        },
     }
 }
 
+# Тесты работают с кешем в памяти (см. core.test_runner)
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 CRISPY_TEMPLATE_PACK = 'bootstrap4'